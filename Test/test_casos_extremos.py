@@ -35,9 +35,12 @@ def _make_part(text: str):
     return Part(root=TextPart(text=text))
 
 
-def _make_file_part(pdf_bytes: bytes, filename: str = "contrato.pdf"):
+def _make_file_part(pdf_bytes: bytes, filename: str = "contrato.pdf", encode=None):
+    import base64
     from a2a.types import FilePart, Part, FileWithBytes
-    return Part(root=FilePart(file=FileWithBytes(bytes=pdf_bytes, filename=filename)))
+    # En A2A los bytes del archivo viajan en base64
+    encoded = (encode or base64.b64encode)(pdf_bytes).decode("ascii")
+    return Part(root=FilePart(file=FileWithBytes(bytes=encoded, filename=filename)))
 
 
 def _make_context(parts):
@@ -310,6 +313,32 @@ class TestPDFCorrupto:
 
             sm_mock.store_chunks.assert_not_called()
 
+    def test_base64_partido_en_lineas_no_se_descarta(self):
+        """
+        El base64 estilo MIME (saltos de línea cada 76 caracteres) es válido:
+        el PDF debe decodificarse entero y llegar a la extracción de texto.
+        """
+        import base64
+        executor = _make_almacenador_executor()
+        executor.pdf_processor.extract_text_from_pdf.return_value = ""
+        pdf = b"%PDF-1.4 contrato " + bytes(range(256)) * 2
+
+        with patch("almacenador_agent.agent_executor.storage_manager") as sm_mock, \
+             patch("almacenador_agent.agent_executor.TaskUpdater") as updater_cls, \
+             patch("almacenador_agent.agent_executor.get_pdf_metadata", return_value={"pages": 1}), \
+             patch("almacenador_agent.agent_executor._save_metric"):
+
+            sm_mock.available = True
+            updater_cls.return_value = _make_updater_mock()
+
+            parts = [
+                _make_file_part(pdf, "lineas.pdf", encode=base64.encodebytes),
+                _make_part("Almacena el documento con el nombre lineas.")
+            ]
+            _run(executor.execute(_make_context(parts), _make_event_queue()))
+
+            executor.pdf_processor.extract_text_from_pdf.assert_called_once_with(pdf)
+
 
 # ═════════════════════════════════════════════════════════════════════════════
 # CASO 3: Qdrant sin conexión
@@ -24,7 +24,9 @@ import hashlib
 import uuid
 import re
 import json
+import numpy as np
 import pytest
+from collections import OrderedDict
 from unittest.mock import MagicMock, patch
 
 
@@ -62,9 +64,16 @@ def _make_storage_manager(collection_name="contratos"):
     manager.analysis_collection = f"{collection_name}_analysis"
     manager.available = True
     manager._embedding_size = 384
+    manager._search_cache = OrderedDict()
+    manager._embedding_cache = OrderedDict()
+    manager._exists_cache = OrderedDict()
 
     embedding_model = MagicMock()
-    embedding_model.encode.return_value = [0.1] * 384
+    # encode() devuelve un ndarray: un vector por texto si recibe una lista
+    embedding_model.encode.side_effect = lambda texts, **kw: (
+        np.full((len(texts), 384), 0.1, dtype=np.float32)
+        if isinstance(texts, list) else np.full(384, 0.1, dtype=np.float32)
+    )
     manager._embedding_model = embedding_model
 
     return manager
@@ -167,6 +176,29 @@ class TestAlmacenar:
         assert result["document_id"] == "uuid-existente"
         manager._delete_document_chunks.assert_called_once_with("uuid-existente")
 
+    def test_reintento_detecta_el_duplicado_sin_volver_a_consultar_qdrant(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = ([], None)
+
+        primero = manager.store_chunks(["chunk"], full_content="contenido", filename="a.pdf")
+        segundo = manager.store_chunks(["chunk"], full_content="contenido", filename="a.pdf")
+
+        manager.client.scroll.assert_called_once()
+        assert segundo["was_updated"] is True
+        assert segundo["document_id"] == primero["document_id"]
+
+    def test_fallo_al_almacenar_descarta_el_no_existe_cacheado(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = ([], None)
+        manager.client.upsert.side_effect = [Exception("timeout"), None]
+
+        fallido = manager.store_chunks(["chunk"], full_content="contenido", filename="a.pdf")
+        manager.store_chunks(["chunk"], full_content="contenido", filename="a.pdf")
+
+        assert fallido["status"] == "error"
+        # El reintento vuelve a comprobar en Qdrant si quedaron chunks del intento fallido
+        assert manager.client.scroll.call_count == 2
+
     def test_nuevo_documento_was_updated_es_false(self):
         manager = _make_storage_manager()
         manager._get_embedding = MagicMock(return_value=[0.0] * 384)
@@ -181,11 +213,11 @@ class TestAlmacenar:
         manager._get_embedding = MagicMock(return_value=[0.0] * 384)
         manager.client.scroll.return_value = ([], None)
         captured = []
-        manager.client.upsert.side_effect = lambda collection_name, points: captured.extend(points)
+        manager.client.upsert.side_effect = lambda collection_name, points: captured.extend(points.payloads)
 
         manager.store_chunks(["texto del chunk"], filename="prueba.pdf")
 
-        payload = captured[0].payload
+        payload = captured[0]
         for campo in ["contenido", "document_id", "filename", "stored_at", "chunk_index", "total_chunks"]:
             assert campo in payload, f"Campo '{campo}' faltante en payload"
 
@@ -199,6 +231,162 @@ class TestAlmacenar:
         assert result["status"] == "error"
         assert result["chunks_stored"] == 0
 
+    def test_sube_los_chunks_en_lotes_ordenados(self):
+        from almacenador_agent import qdrant_storage
+        manager = _make_storage_manager()
+        manager._get_embedding = MagicMock(return_value=[0.0] * 384)
+        manager.client.scroll.return_value = ([], None)
+        lotes = []
+        manager.client.upsert.side_effect = lambda collection_name, points, **kw: lotes.append((points, kw))
+
+        chunks = [f"chunk {i}" for i in range(5)]
+        with patch.object(qdrant_storage, "UPSERT_BATCH_SIZE", 2):
+            result = manager.store_chunks(chunks)
+
+        # Los lotes intermedios se envían en paralelo sin esperar el indexado;
+        # el último va al final y de forma síncrona
+        assert [len(points.ids) for points, _ in lotes] == [2, 2, 1]
+        ids = [point_id for points, _ in lotes for point_id in points.ids]
+        assert all(point_id == str(uuid.UUID(point_id)) and uuid.UUID(point_id).version == 4 for point_id in ids)
+        assert len(set(ids)) == 5
+        assert all(kw == {"wait": False} for _, kw in lotes[:-1])
+        assert lotes[-1][1] == {}
+        indices = sorted(p["chunk_index"] for points, _ in lotes for p in points.payloads)
+        assert indices == list(range(5))
+        assert result["chunks_stored"] == 5
+
+    def test_cada_lote_se_envia_antes_de_vectorizar_el_siguiente(self):
+        from almacenador_agent import qdrant_storage
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = ([], None)
+        eventos = []
+        manager._get_embeddings = MagicMock(
+            side_effect=lambda textos: eventos.append("encode") or [[0.0] * 384 for _ in textos]
+        )
+        manager.client.upsert.side_effect = lambda **kw: eventos.append("upsert")
+
+        # Un solo worker de subida con Executor síncrono para un orden determinista
+        class _Inmediato:
+            def __init__(self, *a, **kw): pass
+            def __enter__(self): return self
+            def __exit__(self, *exc): return False
+            def submit(self, fn, **kw):
+                fn(**kw)
+                return MagicMock()
+
+        with patch.object(qdrant_storage, "UPSERT_BATCH_SIZE", 2), \
+             patch.object(qdrant_storage, "ThreadPoolExecutor", _Inmediato):
+            manager.store_chunks([f"chunk {i}" for i in range(5)])
+
+        assert eventos == ["encode", "upsert", "encode", "upsert", "encode", "upsert"]
+
+    def test_embeddings_de_los_chunks_en_una_sola_llamada(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = ([], None)
+        captured = []
+        manager.client.upsert.side_effect = lambda collection_name, points: captured.extend(points.vectors)
+
+        manager.store_chunks(["uno", "dos", "tres"])
+
+        manager._embedding_model.encode.assert_called_once()
+        assert manager._embedding_model.encode.call_args[0][0] == ["uno", "dos", "tres"]
+        assert all(len(vector) == 384 for vector in captured)
+
+    def test_gestor_global_se_crea_en_el_primer_uso(self):
+        from almacenador_agent import qdrant_storage
+        with patch.object(qdrant_storage, "QdrantStorageManager") as manager_cls, \
+             patch.object(qdrant_storage, "_storage_manager", None):
+            manager_cls.assert_not_called()
+            qdrant_storage.storage_manager.get_stats()
+            qdrant_storage.storage_manager.get_stats()
+
+        manager_cls.assert_called_once()
+
+    def test_reingesta_reutiliza_los_embeddings_cacheados(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = ([], None)
+        manager.client.upsert.return_value = None
+
+        manager.store_chunks(["uno", "dos"])
+        manager.store_chunks(["dos", "tres"])
+
+        textos_codificados = [c.args[0] for c in manager._embedding_model.encode.call_args_list]
+        assert textos_codificados == [["uno", "dos"], ["tres"]]
+
+    def test_modelo_de_embeddings_se_carga_en_el_primer_uso(self):
+        import sys
+        import types
+        manager = _make_storage_manager()
+        del manager._embedding_model  # sin modelo precargado: se usa el valor de clase (None)
+        fake_module = types.ModuleType("sentence_transformers")
+        fake_module.SentenceTransformer = MagicMock()
+        fake_module.SentenceTransformer.return_value.encode.return_value = np.zeros((1, 384))
+
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+             patch("almacenador_agent.qdrant_storage._embedding_model", None), \
+             patch("almacenador_agent.qdrant_storage._embedding_model_loaded", False):
+            manager._get_embedding("uno")
+            manager._get_embedding("dos")
+
+        fake_module.SentenceTransformer.assert_called_once()
+
+    def test_modelo_de_embeddings_se_comparte_entre_gestores(self):
+        import sys
+        import types
+        primero, segundo = _make_storage_manager(), _make_storage_manager()
+        del primero._embedding_model
+        del segundo._embedding_model
+        fake_module = types.ModuleType("sentence_transformers")
+        fake_module.SentenceTransformer = MagicMock()
+
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+             patch("almacenador_agent.qdrant_storage._select_embedding_device", return_value="cuda"), \
+             patch("almacenador_agent.qdrant_storage._embedding_model", None), \
+             patch("almacenador_agent.qdrant_storage._embedding_model_loaded", False):
+            assert primero._load_embedding_model() is segundo._load_embedding_model()
+
+        fake_module.SentenceTransformer.assert_called_once()
+
+    def test_en_cpu_se_prefiere_fastembed_si_esta_instalado(self):
+        import sys
+        import types
+        manager = _make_storage_manager()
+        del manager._embedding_model
+        fake_module = types.ModuleType("fastembed")
+        fake_module.TextEmbedding = MagicMock()
+        fake_module.TextEmbedding.return_value.embed.side_effect = (
+            lambda texts, batch_size: (np.full(384, 0.5, dtype=np.float32) for _ in texts)
+        )
+
+        with patch.dict(sys.modules, {"fastembed": fake_module}), \
+             patch("almacenador_agent.qdrant_storage._select_embedding_device", return_value="cpu"), \
+             patch("almacenador_agent.qdrant_storage._embedding_model", None), \
+             patch("almacenador_agent.qdrant_storage._embedding_model_loaded", False):
+            vectors = manager._get_embeddings(["uno", "dos"])
+
+        fake_module.TextEmbedding.assert_called_once()
+        assert len(vectors) == 2 and len(vectors[0]) == 384
+
+    def test_si_fastembed_falla_se_usa_sentence_transformer(self):
+        import sys
+        import types
+        fastembed = types.ModuleType("fastembed")
+        fastembed.TextEmbedding = MagicMock(side_effect=RuntimeError("sin red para descargar el modelo"))
+        sentence_transformers = types.ModuleType("sentence_transformers")
+        sentence_transformers.SentenceTransformer = MagicMock()
+
+        with patch.dict(sys.modules, {"fastembed": fastembed, "sentence_transformers": sentence_transformers}), \
+             patch("almacenador_agent.qdrant_storage._select_embedding_device", return_value="cpu"), \
+             patch("almacenador_agent.qdrant_storage._embedding_model", None), \
+             patch("almacenador_agent.qdrant_storage._embedding_model_loaded", False):
+            from almacenador_agent.qdrant_storage import get_embedding_model
+            modelo = get_embedding_model()
+            assert get_embedding_model() is modelo
+
+        assert modelo is sentence_transformers.SentenceTransformer.return_value
+        fastembed.TextEmbedding.assert_called_once()
+        sentence_transformers.SentenceTransformer.assert_called_once()
+
     def test_hash_sha256_es_determinista(self):
         manager = _make_storage_manager()
         texto = "Contenido de prueba para hash"
@@ -211,6 +399,15 @@ class TestAlmacenar:
         manager = _make_storage_manager()
         assert manager._calculate_document_hash("A") != manager._calculate_document_hash("B")
 
+    def test_hash_por_bloques_coincide_con_el_del_texto_completo(self):
+        import hashlib
+        manager = _make_storage_manager()
+        texto = "cláusula ñandú € " * 50
+        with patch("almacenador_agent.qdrant_storage.HASH_BLOCK_CHARS", 7):
+            h = manager._calculate_document_hash(texto)
+        assert h == hashlib.sha256(texto.encode("utf-8")).hexdigest()
+        assert manager._calculate_document_hash(texto.encode("utf-8")) == h
+
 
 class TestRecuperar:
     """
@@ -304,6 +501,48 @@ class TestRecuperar:
         result = manager.store_analysis("doc-id", "contenido")
         assert result["status"] == "error"
 
+    def test_store_analysis_vacio_retorna_error_sin_escribir(self):
+        manager = _make_storage_manager()
+        result = manager.store_analysis("doc-id", "")
+
+        assert result["status"] == "error"
+        assert result["analysis_stored"] is False
+        assert "analysis_id" not in result
+        manager.client.upsert.assert_not_called()
+
+    def test_store_analysis_grande_se_divide_en_partes(self):
+        from almacenador_agent.qdrant_storage import ANALYSIS_CHUNK_SIZE
+        manager = _make_storage_manager()
+        manager._get_embedding = MagicMock(return_value=[0.0] * 384)
+        captured = []
+        manager.client.upsert.side_effect = lambda collection_name, points: captured.extend(points)
+
+        contenido = "x" * (ANALYSIS_CHUNK_SIZE * 2 + 10)
+        result = manager.store_analysis("doc-id", contenido)
+
+        assert result["analysis_chunks"] == 3
+        assert captured[0].id == result["analysis_id"]
+        assert {p.payload["analysis_id"] for p in captured} == {result["analysis_id"]}
+        assert "".join(p.payload["analysis_content"] for p in captured) == contenido
+
+    def test_retrieve_reconstruye_analisis_en_partes(self):
+        manager = _make_storage_manager()
+        cabecera = _make_point({
+            "document_id": "doc-1", "analysis_type": "general",
+            "analysis_content": "Primera ", "analysis_chunk_idx": 0, "analysis_total_chunks": 2
+        }, point_id="analisis-1")
+        partes = _scroll_result([
+            {"analysis_content": "y segunda parte", "analysis_chunk_idx": 1},
+            {"analysis_content": "Primera ", "analysis_chunk_idx": 0},
+        ])
+        manager.client.scroll.side_effect = [([cabecera], None), partes]
+
+        results = manager.retrieve_analysis(document_id="doc-1")
+
+        assert len(results) == 1
+        assert results[0]["analysis_content"] == "Primera y segunda parte"
+        assert "analysis_chunk_idx" not in results[0]["metadata"]
+
 
 class TestListar:
     """
@@ -364,6 +603,35 @@ class TestListar:
         assert "documents" in result
         assert "chunks" in result
 
+    def test_get_stats_reutiliza_resultado_dentro_del_ttl(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = _scroll_result([{"document_id": "doc-1"}])
+
+        primero = manager.get_stats()
+        segundo = manager.get_stats()
+
+        assert segundo is primero
+        assert manager.client.scroll.call_count == 2  # documentos + análisis, una sola vez
+
+    def test_get_stats_se_recalcula_tras_almacenar(self):
+        manager = _make_storage_manager()
+        manager.client.scroll.return_value = _scroll_result([{"document_id": "doc-1"}])
+
+        manager.get_stats()
+        manager.store_analysis("doc-1", "Análisis nuevo")
+        manager.get_stats()
+
+        assert manager.client.scroll.call_count == 4
+
+    def test_get_collection_info_reutiliza_resultado_dentro_del_ttl(self):
+        manager = _make_storage_manager()
+
+        primero = manager.get_collection_info()
+        segundo = manager.get_collection_info()
+
+        assert segundo is primero
+        assert manager.client.get_collection.call_count == 2  # una por colección
+
 
 # ═════════════════════════════════════════════════════════════════════════════
 # MÓDULO 2: qdrant_retriever.py — búsqueda por nombre y UUID
@@ -854,4 +1122,919 @@ class TestDetectOperationType:
 
     def test_pdf_tiene_prioridad_sobre_keywords(self):
         parts = self._parts_con_pdf()
-        assert self.executor._detect_operation_type("almacena el análisis", parts) == "store_pdf"
\ No newline at end of file
+        assert self.executor._detect_operation_type("almacena el análisis", parts) == "store_pdf"
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: caché de PDFs ya procesados — reenvío del mismo archivo
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestCachePDFProcesados:
+    """Tests para la caché en proceso de PDFs del AlmacenadorAgentExecutor."""
+
+    def setup_method(self):
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        self.executor = _make_executor()
+        self.executor.pdf_processor.extract_text_from_pdf.return_value = "Texto del contrato."
+
+    def _parts_con_pdf(self, pdf_bytes: bytes):
+        import base64
+        from a2a.types import FilePart, Part, FileWithBytes
+        encoded = base64.b64encode(pdf_bytes).decode("ascii")
+        return [Part(root=FilePart(file=FileWithBytes(bytes=encoded, filename="contrato.pdf")))]
+
+    def _procesar(self, pdf_bytes: bytes):
+        import asyncio
+        with patch("almacenador_agent.agent_executor.get_pdf_metadata", return_value={"num_pages": 1}):
+            return asyncio.get_event_loop().run_until_complete(
+                self.executor._process_pdf_files(self._parts_con_pdf(pdf_bytes))
+            )
+
+    def test_reenvio_del_mismo_pdf_no_vuelve_a_extraer_texto(self):
+        primero = self._procesar(b"%PDF-1.4 contrato")
+        segundo = self._procesar(b"%PDF-1.4 contrato")
+
+        assert segundo["text"] == primero["text"]
+        assert segundo["content_hash"] == primero["content_hash"]
+        self.executor.pdf_processor.extract_text_from_pdf.assert_called_once()
+
+    def test_pdf_distinto_se_extrae_de_nuevo(self):
+        self._procesar(b"%PDF-1.4 contrato A")
+        self._procesar(b"%PDF-1.4 contrato B")
+
+        assert self.executor.pdf_processor.extract_text_from_pdf.call_count == 2
+
+    def test_base64_mal_formado_se_registra_y_se_descarta(self):
+        import asyncio
+        from a2a.types import FilePart, Part, FileWithBytes
+        from almacenador_agent import agent_executor
+        # Con caracteres fuera del alfabeto: sin validate=True se descartarían
+        # en silencio y "JVBERi0x" decodificaría a "%PDF-1"
+        parts = [Part(root=FilePart(file=FileWithBytes(bytes="JVBE!Ri0x", filename="contrato.pdf")))]
+
+        with patch.object(agent_executor.logger, "error") as log_error:
+            resultado = asyncio.get_event_loop().run_until_complete(
+                self.executor._process_pdf_files(parts)
+            )
+
+        assert resultado is None
+        assert "base64" in log_error.call_args[0][0]
+        self.executor.pdf_processor.extract_text_from_pdf.assert_not_called()
+
+    def test_cache_respeta_el_tope_de_bytes(self):
+        from almacenador_agent import tools_agent
+        with patch.object(tools_agent, "_PDF_CACHE_MAX_BYTES", 10):
+            tools_agent.cache_pdf("a", text="12345")
+            tools_agent.cache_pdf("b", text="12345", chunks=["12"])
+            assert list(tools_agent._pdf_cache) == ["b"]
+
+            # 6 caracteres acentuados son 12 bytes en UTF-8
+            tools_agent.cache_pdf("acentos", text="áéíóúñ")
+            assert "acentos" not in tools_agent._pdf_cache
+
+    def test_texto_y_parseo_del_mismo_pdf_se_guardan_una_sola_vez(self):
+        from almacenador_agent import tools_agent
+        pdf = b"%PDF-1.4 contrato"
+        parseo = {"page_texts": ["Texto del contrato."], "info": None}
+        with patch.object(tools_agent, "_pdftotext_pages", return_value=None), \
+             patch.object(tools_agent, "_pdf_backend", return_value="pypdf2"), \
+             patch("PyPDF2.PdfReader") as lector:
+            lector.return_value = MagicMock(
+                pages=[MagicMock(**{"extract_text.return_value": t}) for t in parseo["page_texts"]],
+                metadata=None,
+            )
+            self.executor.pdf_processor.extract_text_from_pdf.side_effect = \
+                tools_agent.PDFProcessor.extract_text_from_pdf
+            resultado = self._procesar(pdf)
+
+        entrada = tools_agent._pdf_cache[resultado["content_hash"]]
+        assert list(tools_agent._pdf_cache) == [resultado["content_hash"]]
+        assert entrada["text"] == resultado["text"]
+        assert "Texto del contrato." in entrada["text"]
+        assert entrada["page_texts"] is None
+        assert entrada["size_bytes"] == len(resultado["text"].encode("utf-8"))
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: chunking por caracteres — fallback sin dependencias semánticas
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestChunkText:
+    """Tests para PDFProcessor.chunk_text."""
+
+    def test_fragmentos_respetan_tamano_y_solapamiento(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        texto = "".join(chr(ord("a") + i % 26) for i in range(2500))
+        chunks = PDFProcessor.chunk_text(texto, chunk_size=1000, overlap=200)
+
+        assert [len(c) for c in chunks] == [1000, 1000, 900, 100]
+        assert chunks[0][-200:] == chunks[1][:200]
+
+    def test_fragmentos_no_parten_palabras(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        palabras = [f"palabra{i:03d}" for i in range(300)]
+        texto = " ".join(palabras)
+        chunks = PDFProcessor.chunk_text(texto, chunk_size=100, overlap=20)
+
+        assert all(len(c) <= 100 for c in chunks)
+        fragmentos = [p for c in chunks for p in c.split()]
+        assert set(fragmentos) == set(palabras)
+        assert chunks[0].split()[-1] in chunks[1]
+
+    def test_ajusta_cortes_a_cualquier_espacio_en_blanco(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        separadores = ["\t", "\u00a0", "\r", "\u2003"]
+        palabras = [f"palabra{i:03d}" for i in range(200)]
+        texto = "".join(p + separadores[i % len(separadores)] for i, p in enumerate(palabras))
+        chunks = PDFProcessor.chunk_text(texto, chunk_size=100, overlap=20)
+
+        fragmentos = [p for c in chunks for p in c.split()]
+        assert set(fragmentos) == set(palabras)
+
+    def test_sin_espacios_conserva_la_rejilla_fija(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        texto = "".join(chr(ord("a") + i % 26) for i in range(2500))
+        chunk_size, overlap = 300, 50
+        esperado = [texto[i:i + chunk_size] for i in range(0, len(texto), chunk_size - overlap)]
+
+        assert PDFProcessor.chunk_text(texto, chunk_size=chunk_size, overlap=overlap) == esperado
+
+    def test_descarta_fragmentos_vacios(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        assert PDFProcessor.chunk_text("   \n  ", chunk_size=4, overlap=1) == []
+
+    def test_overlap_mayor_o_igual_que_chunk_size_lanza_error(self):
+        from almacenador_agent.tools_agent import PDFProcessor
+        with pytest.raises(ValueError):
+            PDFProcessor.chunk_text("texto", chunk_size=100, overlap=100)
+
+    def test_iter_chunk_text_genera_los_mismos_fragmentos_de_forma_perezosa(self):
+        import types
+        from almacenador_agent.tools_agent import PDFProcessor
+        texto = "palabra " * 400
+        generador = PDFProcessor.iter_chunk_text(texto, chunk_size=300, overlap=50)
+
+        assert isinstance(generador, types.GeneratorType)
+        assert list(generador) == PDFProcessor.chunk_text(texto, chunk_size=300, overlap=50)
+
+    @staticmethod
+    def _codificacion_bpe_real():
+        # Codificación tiktoken auténtica construida sin red: un token por byte
+        # más unas pocas fusiones, así que cada palabra ocupa varios tokens
+        tiktoken = pytest.importorskip("tiktoken")
+        rangos = {bytes([b]): b for b in range(256)}
+        for fusion in (b" p", b" pa", b"la", b"bra", "ción".encode(), b" es"):
+            rangos[fusion] = len(rangos)
+        return tiktoken.Encoding(
+            name="prueba_bytes",
+            pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+            mergeable_ranks=rangos,
+            special_tokens={},
+        )
+
+    def test_token_chunk_text_no_parte_palabras_con_bpe_multitoken(self):
+        from almacenador_agent import tools_agent
+        codificacion = self._codificacion_bpe_real()
+        palabras = ["palabra", "fragmentación", "es", "extraordinariamente", "útil", "para", "búsqueda"]
+        texto = " ".join(palabras * 30)
+        assert len(codificacion.encode(texto)) > 2 * len(texto.split())
+
+        with patch.object(tools_agent, "get_token_encoding", return_value=codificacion):
+            chunks = tools_agent.PDFProcessor.token_chunk_text(texto, chunk_size=25, overlap=8)
+
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert set(chunk.split()) <= set(palabras)
+            assert len(codificacion.encode(chunk)) <= 25
+        # El solapamiento repite palabras completas del fragmento anterior
+        assert chunks[1].split()[0] in chunks[0].split()
+        assert chunks[-1].split()[-1] == palabras[-1]
+
+    def test_token_chunk_text_solo_corta_palabras_mas_largas_que_la_ventana(self):
+        from almacenador_agent import tools_agent
+        codificacion = self._codificacion_bpe_real()
+        texto = "corta " + "x" * 60 + " final"
+
+        with patch.object(tools_agent, "get_token_encoding", return_value=codificacion):
+            chunks = tools_agent.PDFProcessor.token_chunk_text(texto, chunk_size=10, overlap=2)
+
+        assert chunks[0] == "corta"
+        assert "".join(c for c in chunks[1:] if set(c) == {"x"}).count("x") >= 60
+        assert chunks[-1].endswith("final")
+
+    def test_get_token_encoding_reintenta_tras_un_fallo(self):
+        from almacenador_agent import tools_agent
+        tiktoken_falso = MagicMock()
+        tiktoken_falso.get_encoding.side_effect = [OSError("sin red"), "codificacion"]
+
+        with patch.object(tools_agent, "tiktoken", tiktoken_falso), \
+             patch.object(tools_agent, "_token_encoding", None), \
+             patch.object(tools_agent, "_token_encoding_retry_at", 0.0), \
+             patch.object(tools_agent, "_TOKEN_ENCODING_RETRY_S", 0.0):
+            assert tools_agent.get_token_encoding() is None
+            assert tools_agent.get_token_encoding() == "codificacion"
+            assert tools_agent.get_token_encoding() == "codificacion"
+
+        assert tiktoken_falso.get_encoding.call_count == 2
+
+    def test_token_chunk_text_sin_tiktoken_usa_chunk_text(self):
+        from almacenador_agent import tools_agent
+        texto = "palabra " * 400
+
+        with patch.object(tools_agent, "get_token_encoding", return_value=None):
+            chunks = tools_agent.PDFProcessor.token_chunk_text(texto)
+
+        assert chunks == tools_agent.PDFProcessor.chunk_text(texto)
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: metadatos y texto del PDF comparten un único parseo
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestParseoPDFCompartido:
+    """Tests para el parseo de _parse_pdf en tools_agent y su caché."""
+
+    def _pdf_en_blanco(self, titulo: str) -> bytes:
+        import io
+        import PyPDF2
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(width=100, height=100)
+        writer.add_metadata({"/Title": titulo})
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    def test_metadatos_y_texto_abren_el_pdf_una_sola_vez(self):
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        pdf = self._pdf_en_blanco("Contrato")
+
+        # Backend activo: PyMuPDF si está instalado, PyPDF2 en otro caso
+        import PyPDF2
+        backend = (tools_agent.pymupdf, "open") if tools_agent.pymupdf else (PyPDF2, "PdfReader")
+
+        with patch.object(*backend, wraps=getattr(*backend)) as abrir_pdf:
+            metadata = tools_agent.get_pdf_metadata(pdf)
+            tools_agent.PDFProcessor.extract_text_from_pdf(pdf)
+
+        assert metadata["num_pages"] == 1
+        assert metadata["title"] == "Contrato"
+        assert abrir_pdf.call_count == 1
+
+    def test_importar_tools_agent_no_carga_pypdf2(self):
+        import os
+        import subprocess
+        import sys
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        codigo = "import sys, almacenador_agent.tools_agent; print('PyPDF2' in sys.modules)"
+        salida = subprocess.run([sys.executable, "-c", codigo], cwd=raiz, capture_output=True, text=True, check=True)
+
+        assert salida.stdout.strip() == "False"
+
+    def test_importar_main_no_carga_el_servidor(self):
+        # Los workers del pool de extracción (spawn) reejecutan main.py como __mp_main__
+        import os
+        import subprocess
+        import sys
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        codigo = (
+            "import sys, almacenador_agent.main; "
+            "print(sorted(m for m in ('a2a', 'uvicorn', 'qdrant_client', 'google.adk') if m in sys.modules))"
+        )
+        salida = subprocess.run([sys.executable, "-c", codigo], cwd=raiz, capture_output=True, text=True, check=True)
+
+        assert salida.stdout.strip() == "[]"
+
+    def test_cache_de_parseos_respeta_el_tope_de_bytes(self):
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        parseos = {
+            b"a": {"page_texts": ["12345"], "info": None},
+            b"b": {"page_texts": ["123", "45"], "info": None},
+            b"enorme": {"page_texts": ["x" * 11], "info": None},
+        }
+
+        with patch.object(tools_agent, "_PDF_CACHE_MAX_BYTES", 10), \
+             patch.object(tools_agent, "_pdftotext_pages", return_value=None), \
+             patch.object(tools_agent, "_pdf_backend", return_value="pypdf2"), \
+             patch("PyPDF2.PdfReader") as lector:
+            for contenido, parseo in parseos.items():
+                lector.return_value = MagicMock(
+                    pages=[MagicMock(**{"extract_text.return_value": t}) for t in parseo["page_texts"]],
+                    metadata=None,
+                )
+                tools_agent._parse_pdf(contenido)
+                if contenido == b"b":
+                    assert len(tools_agent._pdf_cache) == 2
+
+        # "enorme" desaloja a las demás y tampoco cabe por sí solo
+        assert len(tools_agent._pdf_cache) == 0
+
+    def test_pymupdf_no_se_usa_desde_dos_hilos_a_la_vez(self):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from almacenador_agent import tools_agent
+        if tools_agent.pymupdf is None:
+            pytest.skip("PyMuPDF no instalado")
+        tools_agent._pdf_cache.clear()
+        abrir_original = tools_agent.pymupdf.open
+        activos, maximo, lock = [0], [0], threading.Lock()
+
+        def abrir_contando(*args, **kwargs):
+            with lock:
+                activos[0] += 1
+                maximo[0] = max(maximo[0], activos[0])
+            time.sleep(0.05)
+            with lock:
+                activos[0] -= 1
+            return abrir_original(*args, **kwargs)
+
+        pdfs = [self._pdf_en_blanco(f"Contrato {i}") for i in range(4)]
+        with patch.object(tools_agent, "_PDF_BACKEND", "pymupdf"), \
+             patch.object(tools_agent.pymupdf, "open", side_effect=abrir_contando):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(tools_agent.get_pdf_metadata, pdfs))
+
+        assert maximo[0] == 1
+
+    def test_pdfium_no_se_usa_desde_dos_hilos_a_la_vez(self):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from almacenador_agent import tools_agent
+        if tools_agent.pdfium is None:
+            pytest.skip("pypdfium2 no instalado")
+        tools_agent._pdf_cache.clear()
+        documento_original = tools_agent.pdfium.PdfDocument
+        activos, maximo, lock = [0], [0], threading.Lock()
+
+        def abrir_contando(*args, **kwargs):
+            with lock:
+                activos[0] += 1
+                maximo[0] = max(maximo[0], activos[0])
+            time.sleep(0.05)
+            with lock:
+                activos[0] -= 1
+            return documento_original(*args, **kwargs)
+
+        pdfs = [self._pdf_en_blanco(f"Contrato {i}") for i in range(4)]
+        with patch.object(tools_agent, "_PDF_BACKEND", "pdfium"), \
+             patch.object(tools_agent.pdfium, "PdfDocument", side_effect=abrir_contando):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                metadatos = list(pool.map(tools_agent.get_pdf_metadata, pdfs))
+
+        assert maximo[0] == 1
+        assert [m["title"] for m in metadatos] == [f"Contrato {i}" for i in range(4)]
+
+    def test_fallback_pypdf2_sin_pymupdf(self):
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        pdf = self._pdf_en_blanco("Anexo")
+
+        with patch.object(tools_agent, "pymupdf", None), patch.object(tools_agent, "pdfium", None):
+            metadata = tools_agent.get_pdf_metadata(pdf)
+
+        assert metadata == {
+            "num_pages": 1, "has_text": False,
+            "title": "Anexo", "author": "N/A", "subject": "N/A"
+        }
+
+    def test_pdf_sin_diccionario_de_informacion_no_devuelve_titulo(self):
+        from almacenador_agent import tools_agent
+        if tools_agent.pymupdf is None:
+            pytest.skip("PyMuPDF no instalado")
+        tools_agent._pdf_cache.clear()
+        doc = tools_agent.pymupdf.open()
+        doc.new_page()
+
+        with patch.object(tools_agent, "_PDF_BACKEND", "pymupdf"):
+            metadata = tools_agent.get_pdf_metadata(doc.tobytes())
+
+        assert metadata == {"num_pages": 1, "has_text": False}
+
+    def test_backend_pdfium_por_variable_de_entorno(self):
+        from almacenador_agent import tools_agent
+        if tools_agent.pdfium is None or tools_agent.pymupdf is None:
+            pytest.skip("pypdfium2 o PyMuPDF no instalados")
+        tools_agent._pdf_cache.clear()
+        doc = tools_agent.pymupdf.open()
+        doc.new_page().insert_text((72, 72), "Cláusula primera\nCláusula segunda")
+        doc.new_page()
+        doc.set_metadata({"title": "Contrato"})
+        pdf = doc.tobytes()
+
+        with patch.object(tools_agent, "_PDF_BACKEND", "pdfium"), \
+             patch.object(tools_agent.pymupdf, "open", side_effect=AssertionError("no debe usarse")):
+            metadata = tools_agent.get_pdf_metadata(memoryview(pdf))
+            texto = tools_agent.PDFProcessor.extract_text_from_pdf(pdf)
+
+        assert metadata["num_pages"] == 2
+        assert metadata["title"] == "Contrato"
+        assert metadata["author"] == "N/A"
+        assert texto == "--- Página 1 ---\nCláusula primera\nCláusula segunda"
+
+    def test_extraccion_en_paralelo_conserva_el_orden_de_las_paginas(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from almacenador_agent import tools_agent
+        if tools_agent.pymupdf is None:
+            pytest.skip("PyMuPDF no instalado")
+        tools_agent._pdf_cache.clear()
+        doc = tools_agent.pymupdf.open()
+        for i in range(5):
+            doc.new_page().insert_text((72, 72), f"Pagina {i + 1}")
+        pdf = doc.tobytes()
+
+        with ThreadPoolExecutor(max_workers=2) as pool, \
+             patch.object(tools_agent, "_PDF_WORKERS", 2), \
+             patch.object(tools_agent, "_PDF_PARALLEL_MIN_PAGES", 2), \
+             patch.object(tools_agent, "_get_pdf_pool", return_value=pool):
+            page_texts = tools_agent._parse_pdf(pdf)["page_texts"]
+
+        assert [t.strip() for t in page_texts] == [f"Pagina {i + 1}" for i in range(5)]
+
+    def test_validate_pdf_content_acepta_bytes_y_vistas(self):
+        from almacenador_agent.tools_agent import validate_pdf_content
+        pdf = b"%PDF-1.7\n..."
+
+        assert validate_pdf_content(pdf)
+        assert validate_pdf_content(bytearray(pdf))
+        assert validate_pdf_content(memoryview(pdf))
+        assert not validate_pdf_content(b"%PD")
+        assert not validate_pdf_content("%PDF-1.7")
+        assert not validate_pdf_content(None)
+
+    def test_usa_pdftotext_si_esta_instalado(self):
+        import subprocess
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        pdf = self._pdf_en_blanco("Contrato")
+        salida = subprocess.CompletedProcess(args=[], returncode=0, stdout="Cláusula primera\f".encode("utf-8"))
+
+        with patch.object(tools_agent, "_PDFTOTEXT", "/usr/bin/pdftotext"), \
+             patch.object(tools_agent.subprocess, "run", return_value=salida) as run:
+            texto = tools_agent.PDFProcessor.extract_text_from_pdf(pdf)
+
+        run.assert_called_once()
+        assert texto == "--- Página 1 ---\nCláusula primera"
+
+    def test_separa_paginas_y_omite_las_vacias(self):
+        from almacenador_agent import tools_agent
+        paginas = ["Uno", "  \n", "Dos", "Tres"]
+
+        with patch.object(tools_agent, "_parse_pdf", return_value={"page_texts": paginas}):
+            texto = tools_agent.PDFProcessor.extract_text_from_pdf(b"%PDF-")
+
+        assert texto == "--- Página 1 ---\nUno\n\n--- Página 3 ---\nDos\n\n--- Página 4 ---\nTres"
+
+    def test_fallo_de_pdftotext_recurre_al_extractor_de_python(self):
+        import subprocess
+        from almacenador_agent import tools_agent
+        tools_agent._pdf_cache.clear()
+        pdf = self._pdf_en_blanco("Contrato")
+
+        with patch.object(tools_agent, "_PDFTOTEXT", "/usr/bin/pdftotext"), \
+             patch.object(tools_agent.subprocess, "run", side_effect=subprocess.CalledProcessError(1, "pdftotext")):
+            metadata = tools_agent.get_pdf_metadata(pdf)
+
+        assert metadata["num_pages"] == 1
+        assert metadata["title"] == "Contrato"
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: clasificación de partes del mensaje en una sola pasada
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestClasificarPartes:
+    """Tests para _classify_parts del AlmacenadorAgentExecutor."""
+
+    def test_separa_textos_y_archivos_en_orden(self):
+        from a2a.types import FilePart, Part, TextPart, FileWithBytes, FileWithUri
+        from almacenador_agent.agent_executor import _classify_parts
+        pdf = FileWithBytes(bytes="JVBERg==", filename="a.pdf")
+        uri = FileWithUri(uri="http://x/b.pdf")
+        parts = [
+            Part(root=TextPart(text="primero")),
+            Part(root=FilePart(file=pdf)),
+            Part(root=TextPart(text="segundo")),
+            Part(root=FilePart(file=uri)),
+        ]
+
+        texts, files = _classify_parts(parts)
+
+        assert texts == ["primero", "segundo"]
+        assert files == [pdf, uri]
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: modelo del chunking semántico compartido entre peticiones
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestModeloSemanticoCompartido:
+    """Tests para get_sentence_model en tools_agent."""
+
+    def test_el_modelo_se_carga_una_sola_vez(self):
+        import sys
+        import types
+        from almacenador_agent import tools_agent
+        fake_module = types.ModuleType("sentence_transformers")
+        fake_module.SentenceTransformer = MagicMock()
+
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+             patch.object(tools_agent, "_sentence_model", None), \
+             patch("almacenador_agent.qdrant_storage.get_embedding_model", return_value=None):
+            primero = tools_agent.get_sentence_model()
+            segundo = tools_agent.get_sentence_model()
+
+        assert primero is segundo
+        fake_module.SentenceTransformer.assert_called_once()
+
+    def test_reutiliza_el_modelo_del_almacenamiento(self):
+        import sys
+        import types
+        from almacenador_agent import tools_agent
+        fake_module = types.ModuleType("sentence_transformers")
+        fake_module.SentenceTransformer = MagicMock()
+        modelo_almacenamiento = MagicMock()
+
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+             patch.object(tools_agent, "_sentence_model", None), \
+             patch("almacenador_agent.qdrant_storage.get_embedding_model", return_value=modelo_almacenamiento):
+            modelo = tools_agent.get_sentence_model()
+
+        assert modelo is modelo_almacenamiento
+        fake_module.SentenceTransformer.assert_not_called()
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: estados de progreso encolados en el ejecutor del almacenador
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestEstadosEncolados:
+    """Tests para _QueuedTaskUpdater del AlmacenadorAgentExecutor."""
+
+    def test_agrupa_progreso_y_respeta_el_orden_final(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        from a2a.types import TaskState
+        from almacenador_agent.agent_executor import _QueuedTaskUpdater
+        inner = MagicMock()
+        eventos = []
+        inner.update_status = AsyncMock(side_effect=lambda state, **kw: eventos.append((state, kw["message"])))
+        inner.complete = AsyncMock(side_effect=lambda: eventos.append(("complete", None)))
+
+        async def _flujo():
+            updater = _QueuedTaskUpdater(inner, MagicMock())
+            await updater.update_status(TaskState.working, message="uno")
+            await updater.update_status(TaskState.working, message="dos")
+            await updater.complete()
+            await updater.aclose()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(_flujo())
+        finally:
+            loop.close()
+
+        assert eventos == [(TaskState.working, "dos"), ("complete", None)]
+
+    def _updater_que_registra(self, eventos):
+        from unittest.mock import AsyncMock
+        from almacenador_agent.agent_executor import _QueuedTaskUpdater
+        inner = MagicMock()
+        inner.update_status = AsyncMock(side_effect=lambda state, **kw: eventos.append(("estado", state)))
+        inner.complete = AsyncMock(side_effect=lambda: eventos.append(("complete", None)))
+        cola = MagicMock()
+        cola.enqueue_event = AsyncMock(side_effect=lambda evento: eventos.append(("mensaje", evento)))
+        return _QueuedTaskUpdater(inner, cola)
+
+    def test_mensaje_final_se_envia_despues_del_progreso_pendiente(self):
+        import asyncio
+        from a2a.types import TaskState
+        eventos = []
+
+        async def _flujo():
+            updater = self._updater_que_registra(eventos)
+            # Sin ningún await entre el progreso y la respuesta final
+            await updater.update_status(TaskState.working, message="procesando")
+            await updater.enqueue_message("respuesta")
+            await updater.aclose()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(_flujo())
+        finally:
+            loop.close()
+
+        assert eventos == [("estado", TaskState.working), ("mensaje", "respuesta")]
+
+    def test_estadisticas_con_error_no_emiten_progreso_tras_la_respuesta(self):
+        import asyncio
+        from a2a.types import TaskState
+        eventos = []
+        executor = _make_executor()
+
+        async def _flujo():
+            updater = self._updater_que_registra(eventos)
+            try:
+                await executor._handle_get_stats(updater, MagicMock(), "cuantos documentos")
+            finally:
+                await updater.aclose()
+
+        with patch("almacenador_agent.agent_executor.storage_manager") as sm_mock:
+            sm_mock.get_stats.return_value = {"status": "error", "message": "Qdrant caído"}
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(_flujo())
+            finally:
+                loop.close()
+
+        tipos = [tipo for tipo, _ in eventos]
+        assert tipos == ["estado", "mensaje", "complete"]
+        assert eventos[0][1] == TaskState.working
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: caché de resultados de search()
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestCacheBusqueda:
+    """Tests para la caché de search() en QdrantStorageManager."""
+
+    def _hit(self):
+        hit = MagicMock()
+        hit.id = "p1"
+        hit.score = 0.9
+        hit.payload = {"contenido": "cláusula", "document_id": "d1", "filename": "a.pdf"}
+        return hit
+
+    def test_consulta_repetida_no_vuelve_a_qdrant(self):
+        manager = _make_storage_manager()
+        manager.client.query_points.return_value = MagicMock(points=[self._hit()])
+
+        primero = manager.search("plazo de pago")
+        segundo = manager.search("plazo de pago")
+
+        assert primero == segundo
+        manager.client.query_points.assert_called_once()
+
+    def test_modificar_un_resultado_no_altera_la_cache(self):
+        manager = _make_storage_manager()
+        manager.client.query_points.return_value = MagicMock(points=[self._hit()])
+
+        primero = manager.search("plazo de pago")
+        primero[0]["contenido"] = "alterado"
+        primero[0]["metadata"]["extra"] = True
+        primero.pop()
+        segundo = manager.search("plazo de pago")
+        segundo[0]["metadata"]["otro"] = 1
+        tercero = manager.search("plazo de pago")
+
+        manager.client.query_points.assert_called_once()
+        assert tercero[0]["contenido"] == "cláusula"
+        assert tercero[0]["metadata"] == {}
+
+    def test_consultas_que_solo_difieren_en_mayusculas_y_espacios_comparten_cache(self):
+        manager = _make_storage_manager()
+        manager.client.query_points.return_value = MagicMock(points=[self._hit()])
+
+        manager.search("Plazo de pago ")
+        manager.search("plazo  de PAGO")
+
+        manager.client.query_points.assert_called_once()
+        manager._embedding_model.encode.assert_called_once()
+        assert manager._embedding_model.encode.call_args[0][0] == ["plazo de pago"]
+
+    def test_store_chunks_invalida_la_cache(self):
+        manager = _make_storage_manager()
+        manager.client.query_points.return_value = MagicMock(points=[self._hit()])
+        manager.client.scroll.return_value = ([], None)
+
+        manager.search("plazo de pago")
+        manager.store_chunks(["nuevo chunk"])
+        manager.search("plazo de pago")
+
+        assert manager.client.query_points.call_count == 2
+
+    def test_search_many_usa_una_sola_peticion_batch(self):
+        manager = _make_storage_manager()
+        manager.client.query_batch_points.return_value = [
+            MagicMock(points=[self._hit()]), MagicMock(points=[])
+        ]
+
+        resultados = manager.search_many(["plazo de pago", "penalizaciones"])
+
+        manager.client.query_batch_points.assert_called_once()
+        assert len(manager.client.query_batch_points.call_args.kwargs["requests"]) == 2
+        manager._embedding_model.encode.assert_called_once()
+        assert [len(r) for r in resultados] == [1, 0]
+        assert resultados[0][0]["filename"] == "a.pdf"
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: creación de colecciones con varios workers arrancando a la vez
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestCrearColeccion:
+    """Tests para _ensure_collection en QdrantStorageManager."""
+
+    def test_tolera_coleccion_creada_por_otro_proceso(self):
+        manager = _make_storage_manager()
+        # No existe al comprobar, pero otro worker la crea antes que nosotros
+        manager.client.collection_exists.side_effect = [False, True]
+        manager.client.create_collection.side_effect = Exception("Collection `contratos` already exists!")
+
+        assert manager._ensure_collection("contratos") is False
+
+    def test_propaga_otros_errores_de_creacion(self):
+        manager = _make_storage_manager()
+        manager.client.collection_exists.return_value = False
+        manager.client.create_collection.side_effect = Exception("disco lleno")
+
+        with pytest.raises(Exception, match="disco lleno"):
+            manager._ensure_collection("contratos")
+
+    def test_coleccion_existente_recibe_los_indices_que_faltan(self):
+        manager = _make_storage_manager()
+        manager.client.collection_exists.return_value = True
+        manager.client.get_collection.return_value = MagicMock(payload_schema={"document_id": MagicMock()})
+
+        manager._ensure_collection("contratos", {"document_id": "keyword", "document_hash": "keyword"})
+
+        manager.client.create_collection.assert_not_called()
+        manager.client.create_payload_index.assert_called_once_with(
+            collection_name="contratos", field_name="document_hash", field_schema="keyword"
+        )
+
+    def test_coleccion_existente_sin_cuantizacion_la_activa(self):
+        from almacenador_agent.qdrant_storage import QUANTIZATION_CONFIG
+        manager = _make_storage_manager()
+        manager.client.collection_exists.return_value = True
+        info = MagicMock(payload_schema={})
+        info.config.quantization_config = None
+        manager.client.get_collection.return_value = info
+
+        manager._ensure_collection("contratos")
+
+        manager.client.update_collection.assert_called_once_with(
+            collection_name="contratos", quantization_config=QUANTIZATION_CONFIG
+        )
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: borrado de los chunks de un documento
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestBorrarChunks:
+    """Tests para _delete_document_chunks en QdrantStorageManager."""
+
+    def test_borra_por_filtro_sin_scroll_previo(self):
+        from qdrant_client.http import models
+        manager = _make_storage_manager()
+
+        assert manager._delete_document_chunks("doc-1") is True
+
+        manager.client.scroll.assert_not_called()
+        selector = manager.client.delete.call_args.kwargs["points_selector"]
+        assert isinstance(selector, models.FilterSelector)
+        assert selector.filter.must[0].match.value == "doc-1"
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: documento completo con sus análisis
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestDocumentoConAnalisis:
+    """Tests para get_document_with_analysis en QdrantStorageManager."""
+
+    def test_pagina_todos_los_chunks_del_documento(self):
+        manager = _make_storage_manager()
+        manager.retrieve_analysis = MagicMock(return_value=[])
+        pagina_1 = [_make_point({"chunk_index": 1, "contenido": "B", "filename": "a.pdf"})]
+        pagina_2 = [_make_point({"chunk_index": 0, "contenido": "A", "filename": "a.pdf"})]
+        manager.client.scroll.side_effect = [(pagina_1, "cursor"), (pagina_2, None)]
+
+        result = manager.get_document_with_analysis("doc-1")
+
+        assert result["document"]["content"] == "A\nB"
+        assert result["document"]["num_chunks"] == 2
+        assert manager.client.scroll.call_args_list[1].kwargs["offset"] == "cursor"
+
+    def test_analisis_se_consultan_en_paralelo_con_los_chunks(self):
+        import threading
+        manager = _make_storage_manager()
+        analisis_pedidos = threading.Event()
+
+        def retrieve_analysis(document_id):
+            analisis_pedidos.set()
+            return [{"analysis_id": "a1"}]
+
+        def scroll(**kw):
+            # Si los análisis se pidieran después del scroll, esto expiraría
+            assert analisis_pedidos.wait(timeout=5)
+            return [_make_point({"chunk_index": 0, "contenido": "A"})], None
+
+        manager.retrieve_analysis = retrieve_analysis
+        manager.client.scroll.side_effect = scroll
+
+        result = manager.get_document_with_analysis("doc-1")
+
+        assert result["status"] == "success"
+        assert result["analysis_count"] == 1
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: serialización JSON y HTML de las respuestas
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestRespuestaJSON:
+    """Tests para la serialización y el renderizado de ResponseFormatter."""
+
+    def test_json_indentado_equivalente_al_de_json_dumps(self):
+        from almacenador_agent.tools_agent import ResponseFormatter
+        respuesta = {
+            "status": "success",
+            "message": "Análisis almacenado ✅",
+            "data": {"chunks": [1, 2], "vacio": {}, "lista_vacia": [], "ratio": 1e-7, "nada": None},
+        }
+        salida = ResponseFormatter.to_json(respuesta)
+
+        assert json.loads(salida) == respuesta
+        assert "Análisis almacenado ✅" in salida
+        assert salida.startswith('{\n  "status": "success",\n')
+
+    def test_sin_orjson_usa_la_biblioteca_estandar(self):
+        from almacenador_agent import tools_agent
+        with patch.object(tools_agent, "orjson", None):
+            salida = tools_agent.ResponseFormatter.to_json({"título": "Contrato"})
+
+        assert salida == '{\n  "título": "Contrato"\n}'
+
+    def test_response_formatter_es_alias_de_las_funciones_de_modulo(self):
+        from almacenador_agent import tools_agent
+        formatter = tools_agent.ResponseFormatter()
+
+        assert formatter.format_error_response is tools_agent.format_error_response
+        assert tools_agent.ResponseFormatter.to_json is tools_agent.to_json
+        salida = json.loads(tools_agent.format_storage_response(3, 120, "documentos", "doc-1"))
+        assert salida["data"]["chunks_stored"] == 3
+        assert salida["operation"] == "store_pdf"
+
+    def test_html_de_analisis_escapa_el_contenido(self):
+        from almacenador_agent.tools_agent import ResponseFormatter
+        html = ResponseFormatter.render_analysis_response_html([{
+            "analysis_id": "a" * 36,
+            "document_id": "d" * 36,
+            "analysis_type": "general",
+            "created_at": "2024-01-01",
+            "analysis_content": "<script>alert('x')</script> Cláusula & penalización",
+        }])
+
+        assert "<script>" not in html
+        assert "&lt;script&gt;" in html
+        assert "Cláusula &amp; penalización" in html
+
+    def test_html_de_almacenamiento_escapa_nombre_y_mensaje(self):
+        from almacenador_agent.tools_agent import ResponseFormatter
+        html = ResponseFormatter.render_storage_response_html({
+            "status": "success",
+            "operation": "store_pdf",
+            "message": "PDF <b>almacenado</b>",
+            "data": {
+                "filename": "<img src=x onerror=alert(1)>.pdf",
+                "chunks_stored": 3,
+                "total_characters": 120,
+                "collection": "documentos",
+                "document_id": "doc-1",
+                "was_updated": False,
+            },
+        })
+
+        assert "<img" not in html
+        assert "&lt;img src=x onerror=alert(1)&gt;.pdf" in html
+        assert "PDF &lt;b&gt;almacenado&lt;/b&gt;" in html
+        assert "<li><b>Fragmentos almacenados:</b> 3</li>" in html
+
+
+# ═════════════════════════════════════════════════════════════════════════════
+# EXTRA: formateo y chunking desde varios hilos
+# ═════════════════════════════════════════════════════════════════════════════
+
+class TestConcurrenciaHerramientas:
+    """El executor formatea y trocea desde hilos (asyncio.to_thread): sin estado compartido."""
+
+    def test_formateo_y_chunking_concurrentes_dan_el_mismo_resultado(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from almacenador_agent.tools_agent import PDFProcessor, format_storage_response
+        texto = " ".join(f"cláusula{i}" for i in range(3000))
+
+        def tarea(i):
+            return (
+                format_storage_response(i, i * 10, "documentos", f"doc-{i}"),
+                PDFProcessor.chunk_text(texto, chunk_size=500, overlap=100),
+            )
+
+        esperado = [tarea(i) for i in range(16)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            obtenido = list(pool.map(tarea, range(16)))
+
+        assert obtenido == esperado
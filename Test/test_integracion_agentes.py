@@ -35,9 +35,10 @@ def _make_part(text: str):
 
 
 def _make_file_part(pdf_bytes: bytes, filename: str = "contrato.pdf"):
-    """Crea un Part de archivo PDF real compatible con A2A."""
+    """Crea un Part de archivo PDF real compatible con A2A (bytes en base64, como en el protocolo)."""
+    import base64
     from a2a.types import FilePart, Part, FileWithBytes
-    file_obj = FileWithBytes(bytes=pdf_bytes, filename=filename)
+    file_obj = FileWithBytes(bytes=base64.b64encode(pdf_bytes).decode("ascii"), filename=filename)
     return Part(root=FilePart(file=file_obj))
 
 
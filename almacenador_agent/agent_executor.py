@@ -8,15 +8,16 @@ VERSIÓN MEJORADA:
 - NUEVO: Extracción de nombre personalizado del usuario
 """
 
+import asyncio
 import logging
 import base64
-import json
+import binascii
 import os
 import re
 import time                    
 import csv                    
 from datetime import datetime  
-from typing import Optional, List
+from typing import Optional, List, Tuple, Union
 from a2a.server.agent_execution import AgentExecutor
 from a2a.server.agent_execution.context import RequestContext
 from a2a.server.events import EventQueue
@@ -38,13 +39,177 @@ from almacenador_agent.tools_agent import (
     PDFProcessor,
     ResponseFormatter,
     validate_pdf_content,
-    get_pdf_metadata
+    get_pdf_metadata,
+    pdf_content_hash,
+    get_cached_pdf,
+    cache_pdf
 )
 from almacenador_agent.qdrant_storage import storage_manager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Decodificador base64 vectorizado (SIMD) si está instalado; misma API que base64
+try:
+    import pybase64 as _base64
+except ImportError:
+    _base64 = base64
+
+# Tabla de str.translate que elimina los CR/LF del base64 partido en líneas
+_BASE64_LINE_BREAKS = {ord("\n"): None, ord("\r"): None}
+
+# Parts de texto que el protocolo A2A inyecta como historial de la conversación
+_CONTEXT_PREFIX = "For context:"
+_CONTEXT_HISTORY_RE = re.compile(r"\[.*?\] (?:called tool|said:|`)", re.DOTALL)
+
+# Palabras clave de cada operación, en orden de prioridad: la primera
+# categoría con alguna coincidencia en el texto del usuario decide
+_OPERATION_KEYWORDS = [
+    ("store_analysis", [
+        "almacena el análisis",
+        "guarda el análisis",
+        "almacenar análisis",
+        "guardar análisis",
+        "almacena análisis",
+        "guarda análisis"
+    ]),
+    ("retrieve_analysis", [
+        "recupera el análisis",
+        "muestra el análisis",
+        "ver el análisis",
+        "obtener análisis",
+        "mostrar análisis",
+        "ver análisis"
+    ]),
+    ("get_stats", [
+        "cuantos documentos",
+        "cuántos documentos",
+        "cuantos análisis",
+        "cuántos análisis",
+        "cuantos archivos",
+        "cuántos archivos",
+        "estadísticas",
+        "estadisticas",
+        "que hay almacenado",
+        "qué hay almacenado"
+    ]),
+    ("get_analyzed_docs", [
+        "documentos analizados",
+        "documento analizado",
+        "tienen análisis",
+        "tienen analisis",
+        "tiene análisis",
+        "tiene analisis",
+        "han sido analizados",
+        "ya fue analizado",
+        "cuáles tienen análisis",
+        "cuales tienen analisis",
+        "que documentos han",
+        "qué documentos han",
+        "documentos tienen analisis",
+        "documentos tienen análisis",
+        "con análisis",
+        "con analisis"
+    ]),
+]
+# Cada categoría se compila una vez en una alternancia de literales: el texto
+# se recorre una vez por categoría en lugar de una vez por palabra clave
+_OPERATION_KEYWORD_PATTERNS = [
+    (operation, re.compile("|".join(map(re.escape, keywords))))
+    for operation, keywords in _OPERATION_KEYWORDS
+]
+
+
+def _classify_parts(user_parts: List[Part]) -> Tuple[List[str], List[Union[FileWithBytes, FileWithUri]]]:
+    """
+    Recorre una sola vez las partes del mensaje y las separa por tipo.
+    
+    Returns:
+        Tuple con los textos de las TextPart y los archivos de las FilePart, en orden
+    """
+    texts = []
+    files = []
+    for part in user_parts:
+        if isinstance(part, Part):
+            # Tras el isinstance los campos del modelo están garantizados:
+            # acceso directo en lugar de getattr con valor por defecto
+            root = part.root
+            if isinstance(root, TextPart):
+                texts.append(root.text)
+            elif isinstance(root, FilePart) and root.file:
+                files.append(root.file)
+    return texts, files
+
+class _QueuedTaskUpdater:
+    """
+    Envoltorio de TaskUpdater que encola los estados de progreso (working).
+    
+    Los handlers dejan el estado con put_nowait y siguen trabajando sin ceder
+    el event loop; una única tarea consumidora por ejecución vacía la cola y
+    emite solo el estado más reciente de cada tanda. Los eventos finales
+    (mensajes de respuesta, complete, artefactos, failed) esperan a que la
+    cola se vacíe para conservar el orden en el cliente.
+    """
+    
+    def __init__(self, updater: TaskUpdater, event_queue: EventQueue):
+        self._updater = updater
+        self._event_queue = event_queue
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._drain_status_queue())
+    
+    async def _drain_status_queue(self) -> None:
+        while True:
+            pending = [await self._queue.get()]
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            try:
+                await self._updater.update_status(TaskState.working, message=pending[-1])
+            except Exception as e:
+                logger.error("Error enviando estado de progreso: %s", e)
+            finally:
+                for _ in pending:
+                    self._queue.task_done()
+    
+    def new_agent_message(self, *args, **kwargs):
+        return self._updater.new_agent_message(*args, **kwargs)
+    
+    async def submit(self) -> None:
+        await self._updater.submit()
+    
+    async def start_work(self) -> None:
+        await self._updater.start_work()
+    
+    async def update_status(self, state: TaskState, message=None, **kwargs) -> None:
+        if state == TaskState.working and not kwargs:
+            self._queue.put_nowait(message)
+            return
+        await self._queue.join()
+        await self._updater.update_status(state, message=message, **kwargs)
+    
+    async def enqueue_message(self, message) -> None:
+        """Envía un mensaje de respuesta al cliente después de los estados pendientes."""
+        await self._queue.join()
+        await self._event_queue.enqueue_event(message)
+    
+    async def add_artifact(self, *args, **kwargs) -> None:
+        await self._queue.join()
+        await self._updater.add_artifact(*args, **kwargs)
+    
+    async def complete(self, *args, **kwargs) -> None:
+        await self._queue.join()
+        await self._updater.complete(*args, **kwargs)
+    
+    async def aclose(self) -> None:
+        """Emite los estados pendientes y detiene la tarea consumidora."""
+        try:
+            await self._queue.join()
+        finally:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+
 def _save_metric(agente, operacion, documento, elapsed, status):
     file_exists = os.path.exists("metrics.csv")
     with open("metrics.csv", "a", newline="", encoding="utf-8") as f:
@@ -94,10 +259,12 @@ class AlmacenadorAgentExecutor(AgentExecutor):
         3. Recuperar análisis (por document_id o búsqueda general)
         """
         
-        logger.info(f"🚀 Iniciando ejecución del agente almacenador")
-        logger.info(f"📦 Contexto recibido: task_id={context.task_id}, context_id={context.context_id}")
+        task_id, context_id = context.task_id, context.context_id
+        logger.info("🚀 Iniciando ejecución del agente almacenador")
+        logger.info("📦 Contexto recibido: task_id=%s, context_id=%s", task_id, context_id)
         
-        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
+        # Los estados de progreso se encolan y los emite una sola tarea consumidora
+        updater = _QueuedTaskUpdater(TaskUpdater(event_queue, task_id, context_id), event_queue)
         
         try:
             # ==========================================
@@ -113,41 +280,33 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             user_text = ""
             user_parts = []
             
-            if hasattr(context, 'message') and context.message:
-                message = context.message
-                logger.info(f"📨 Message received")
+            # RequestContext.message y Message.parts son campos declarados:
+            # basta con comprobar que no estén vacíos
+            message = context.message
+            if message:
+                logger.info("📨 Message received")
                 
-                if hasattr(message, 'parts') and message.parts:
+                if message.parts:
                     user_parts = message.parts
-                    
-                    # Recopilar todas las parts de texto
-                    text_parts = []
-                    for part in user_parts:
-                        if isinstance(part, Part):
-                            root = getattr(part, 'root', None)
-                            if isinstance(root, TextPart):
-                                text_parts.append(root.text)
+                    texts, _ = _classify_parts(user_parts)
                     
                     # La instrucción real es la ÚLTIMA part de texto.
                     # Las anteriores son historial inyectado por el protocolo A2A.
-                    # Filtramos parts de contexto para quedarnos solo con la instrucción actual.
-                    actual_instruction_parts = [
-                        t for t in text_parts
-                        if not t.startswith("For context:")
-                        and not (t.startswith("[") and ("] called tool" in t or "] said:" in t or "] `" in t))
-                    ]
-                    
-                    # Tomar la última instrucción real
-                    user_text = actual_instruction_parts[-1] if actual_instruction_parts else ""
+                    # Se descartan las parts de contexto y se conserva solo
+                    # la última instrucción real.
+                    for text in texts:
+                        if text.startswith(_CONTEXT_PREFIX) or _CONTEXT_HISTORY_RE.match(text):
+                            continue
+                        user_text = text
                         
-            logger.info(f"📝 Texto extraído: {user_text[:100] if user_text else 'Sin texto'}")
-            logger.info(f"📦 Número de partes: {len(user_parts)}")
+            logger.info("📝 Texto extraído: %s", user_text[:100] if user_text else 'Sin texto')
+            logger.info("📦 Número de partes: %d", len(user_parts))
             
             # ==========================================
             # PASO 2: DETERMINAR TIPO DE OPERACIÓN
             # ==========================================
             operation_type = self._detect_operation_type(user_text, user_parts)
-            logger.info(f"🎯 Operación detectada: {operation_type}")
+            logger.info("🎯 Operación detectada: %s", operation_type)
             
             # Ejecutar operación correspondiente
             if operation_type == "store_pdf":
@@ -185,12 +344,12 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                         Part(root=TextPart(text=error_msg))
                     ])
                 )
-                await event_queue.enqueue_event(new_agent_text_message(error_msg))
+                await updater.enqueue_message(new_agent_text_message(error_msg))
             
             logger.info("✅ Ejecución completada exitosamente")
             
         except Exception as e:
-            logger.error(f'❌ Error durante la ejecución: {str(e)}', exc_info=True)
+            logger.error('❌ Error durante la ejecución: %s', e, exc_info=True)
             
             # Crear respuesta de error en JSON
             error_response = self.response_formatter.format_error_response(
@@ -208,12 +367,15 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                     ])
                 )
             except Exception as update_error:
-                logger.error(f"Error actualizando estado: {update_error}")
+                logger.error("Error actualizando estado: %s", update_error)
             
             # Enviar al event queue
-            await event_queue.enqueue_event(new_agent_text_message(error_response))
+            await updater.enqueue_message(new_agent_text_message(error_response))
             
             raise ServerError(error=InternalError()) from e
+        
+        finally:
+            await updater.aclose()
     
     
     def _detect_operation_type(self, user_text: str, user_parts: List[Part]) -> str:
@@ -223,87 +385,19 @@ class AlmacenadorAgentExecutor(AgentExecutor):
         Returns:
             str: "store_pdf", "store_analysis", "retrieve_analysis", "unknown"
         """
-        user_text_lower = user_text.lower()
-        
-        # Verificar si hay archivos PDF
-        has_pdf = any(
-            isinstance(getattr(part, 'root', None), FilePart)
-            for part in user_parts
-        )
-        
-        # Palabras clave para almacenar análisis
-        store_analysis_keywords = [
-            "almacena el análisis",
-            "guarda el análisis",
-            "almacenar análisis",
-            "guardar análisis",
-            "almacena análisis",
-            "guarda análisis"
-        ]
-        
-        # Palabras clave para recuperar análisis
-        retrieve_analysis_keywords = [
-            "recupera el análisis",
-            "muestra el análisis",
-            "ver el análisis",
-            "obtener análisis",
-            "mostrar análisis",
-            "ver análisis"
-        ]
-        
-        # Palabras clave para estadísticas
-        stats_keywords = [
-            "cuantos documentos",
-            "cuántos documentos",
-            "cuantos análisis",
-            "cuántos análisis",
-            "cuantos archivos",
-            "cuántos archivos",
-            "estadísticas",
-            "estadisticas",
-            "que hay almacenado",
-            "qué hay almacenado"
-        ]
-
-        # Palabras clave para documentos analizados
-        analyzed_docs_keywords = [
-            "documentos analizados",
-            "documento analizado",
-            "tienen análisis",
-            "tienen analisis",
-            "tiene análisis",
-            "tiene analisis",
-            "han sido analizados",
-            "ya fue analizado",
-            "cuáles tienen análisis",
-            "cuales tienen analisis",
-            "que documentos han",  
-            "qué documentos han",
-            "documentos tienen analisis",
-            "documentos tienen análisis",
-            "con análisis",
-            "con analisis"
-        ]
-
-
-        # Decisión de operación
+        # Verificar si hay archivos PDF: es la operación decisiva, se resuelve
+        # antes de recorrer el texto del usuario
+        has_pdf = any(isinstance(part.root, FilePart) for part in user_parts)
         if has_pdf:
             return "store_pdf"
         
-        elif any(keyword in user_text_lower for keyword in store_analysis_keywords):
-            return "store_analysis"
-        
-        elif any(keyword in user_text_lower for keyword in retrieve_analysis_keywords):
-            return "retrieve_analysis"
-        
-        elif any(keyword in user_text_lower for keyword in stats_keywords):
-            return "get_stats"
-        
-        elif any(keyword in user_text_lower for keyword in analyzed_docs_keywords):
-            return "get_analyzed_docs"
-        
-        else:
-            return "unknown"
+        # Una búsqueda por categoría con su alternancia precompilada, en orden
+        # de prioridad (ver _OPERATION_KEYWORDS)
+        user_text_lower = user_text.lower()
+        for operation, pattern in _OPERATION_KEYWORD_PATTERNS:
+            if pattern.search(user_text_lower):
+                return operation
+        return "unknown"
     
     
     def _extract_custom_filename(self, user_text: str) -> Optional[str]:
@@ -345,7 +439,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                 custom_name = re.sub(r'[<>:"/\\|?*]', '', custom_name)
                 
                 if custom_name:
-                    logger.info(f"📝 Nombre personalizado detectado: '{custom_name}'")
+                    logger.info("📝 Nombre personalizado detectado: '%s'", custom_name)
                     # Asegurarnos de que tenga extensión .pdf
                     if not custom_name.lower().endswith('.pdf'):
                         custom_name = f"{custom_name}.pdf"
@@ -357,7 +451,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
     
     async def _handle_store_pdf(
         self,
-        updater: TaskUpdater,
+        updater: _QueuedTaskUpdater,
         event_queue: EventQueue,
         user_parts: List[Part],
         user_text: str,
@@ -385,7 +479,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             logger.warning("⚠️ El usuario no proporcionó un nombre para el documento")
             
             # Primero notifica el error al cliente vía event_queue
-            await event_queue.enqueue_event(new_agent_text_message(error_msg))
+            await updater.enqueue_message(new_agent_text_message(error_msg))
             
             # Luego cierra la tarea en estado "failed" correctamente
             await updater.update_status(
@@ -407,37 +501,42 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                     Part(root=TextPart(text=error_msg))
                 ])
             )
-            await event_queue.enqueue_event(new_agent_text_message(error_msg))
+            await updater.enqueue_message(new_agent_text_message(error_msg))
             return
         
-        # Fragmentar el texto con chunking semántico
-        # Agrupa oraciones por coherencia temática en lugar de cortar por caracteres
+        # Un único estado de progreso para fragmentación + almacenamiento: cada
+        # update_status es un evento más hacia el cliente
         await updater.update_status(
             TaskState.working,
             message=updater.new_agent_message([
-                Part(root=TextPart(text="🧠 Analizando estructura semántica del documento..."))
+                Part(root=TextPart(text=f"🧠 Fragmentando y almacenando en Qdrant como '{pdf_result['filename']}'..."))
             ])
         )
         
-        try:
-            chunks = self.pdf_processor.semantic_chunking(
-                pdf_result['text'],
-                similarity_threshold=0.5  # Ajustar según el dominio: más alto = chunks más pequeños
-            )
-        except ImportError:
-            # Fallback a chunking por caracteres si las dependencias no están instaladas
-            logger.warning("⚠️ Usando chunking por caracteres como fallback")
-            chunks = self.pdf_processor.chunk_text(pdf_result['text'])
-        
-        await updater.update_status(
-            TaskState.working,
-            message=updater.new_agent_message([
-                Part(root=TextPart(text=f"💾 Almacenando en Qdrant como '{pdf_result['filename']}'..."))
-            ])
-        )
+        # Fragmentar el texto con chunking semántico
+        # Agrupa oraciones por coherencia temática en lugar de cortar por caracteres
+        cached_pdf = get_cached_pdf(pdf_result['content_hash'])
+        if cached_pdf and cached_pdf.get('chunks') is not None:
+            logger.info("♻️ Reutilizando chunks de un PDF idéntico procesado previamente")
+            chunks = cached_pdf['chunks']
+        else:
+            # El chunking es CPU intensivo: se ejecuta en un hilo para no bloquear el event loop
+            if self.pdf_processor.SEMANTIC_AVAILABLE:
+                chunks = await asyncio.to_thread(
+                    self.pdf_processor.semantic_chunking,
+                    pdf_result['text'],
+                    similarity_threshold=0.5  # Ajustar según el dominio: más alto = chunks más pequeños
+                )
+            else:
+                # Fallback a chunking por tokens (o por caracteres sin tiktoken)
+                # si las dependencias del chunking semántico no están instaladas
+                logger.warning("⚠️ Usando chunking por tokens como fallback")
+                chunks = await asyncio.to_thread(self.pdf_processor.token_chunk_text, pdf_result['text'])
+            cache_pdf(pdf_result['content_hash'], chunks=chunks)
         
-        # Almacenar en Qdrant (con el nombre correcto)
-        storage_result = storage_manager.store_chunks(
+        # Almacenar en Qdrant (con el nombre correcto); embeddings y upsert en un hilo
+        storage_result = await asyncio.to_thread(
+            storage_manager.store_chunks,
             chunks=chunks,
             metadata={
                 "source": "a2a_protocol",
@@ -467,9 +566,9 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             
             # Renderizar HTML
             html_response = self.response_formatter.render_storage_response_html(response_data)
-            json_response = json.dumps(response_data, indent=2, ensure_ascii=False)
+            json_response = self.response_formatter.to_json(response_data)
             
-            await event_queue.enqueue_event(new_agent_text_message(html_response))
+            await updater.enqueue_message(new_agent_text_message(html_response))
             await updater.add_artifact([Part(root=TextPart(text=json_response))])
 
             # Calcular tiempo y guardar métrica:
@@ -489,12 +588,12 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             # Calcular tiempo y guardar métrica:
             _save_metric("almacenador", "store_pdf", pdf_result.get('filename','-'),
                         time.time() - start_time, "error")   
-            await event_queue.enqueue_event(new_agent_text_message(error_msg))
+            await updater.enqueue_message(new_agent_text_message(error_msg))
     
     
     async def _handle_store_analysis(
         self,
-        updater: TaskUpdater,
+        updater: _QueuedTaskUpdater,
         event_queue: EventQueue,
         user_text: str,
         context: RequestContext
@@ -528,7 +627,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                     Part(root=TextPart(text=error_msg))
                 ])
             )
-            await event_queue.enqueue_event(new_agent_text_message(error_msg))
+            await updater.enqueue_message(new_agent_text_message(error_msg))
             return
         
         document_id = match.group(1)
@@ -545,15 +644,17 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                     Part(root=TextPart(text=error_msg))
                 ])
             )
-            await event_queue.enqueue_event(new_agent_text_message(error_msg))
+            await updater.enqueue_message(new_agent_text_message(error_msg))
             return
         
-        logger.info(f"📝 Almacenando análisis para documento: {document_id}")
-        logger.info(f"📝 Longitud del análisis: {len(analysis_content)} caracteres")
+        logger.info("📝 Almacenando análisis para documento: %s", document_id)
+        logger.info("📝 Longitud del análisis: %d caracteres", len(analysis_content))
         
-        # Almacenar el análisis
-        filename = storage_manager.get_filename_by_document_id(document_id)
-        storage_result = storage_manager.store_analysis(
+        # Almacenar el análisis. Las llamadas a Qdrant son bloqueantes (red +
+        # embeddings): se ejecutan en un hilo para no detener el event loop
+        filename = await asyncio.to_thread(storage_manager.get_filename_by_document_id, document_id)
+        storage_result = await asyncio.to_thread(
+            storage_manager.store_analysis,
             document_id=document_id,
             analysis_content=analysis_content,
             analysis_type="general",
@@ -575,13 +676,13 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             <p><b>Longitud:</b> {len(analysis_content)} caracteres</p>
             """
             
-            json_response = json.dumps(storage_result, indent=2)
+            json_response = self.response_formatter.to_json(storage_result)
             
         else:
             html_response = f"❌ Error almacenando análisis: {storage_result.get('message')}"
-            json_response = json.dumps(storage_result, indent=2)
+            json_response = self.response_formatter.to_json(storage_result)
         
-        await event_queue.enqueue_event(new_agent_text_message(html_response))
+        await updater.enqueue_message(new_agent_text_message(html_response))
         await updater.add_artifact([Part(root=TextPart(text=json_response))])
         
         # Calcular tiempo y guardar métrica:
@@ -593,7 +694,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
     
     async def _handle_retrieve_analysis(
     self,
-    updater: TaskUpdater,
+    updater: _QueuedTaskUpdater,
     event_queue: EventQueue,
     user_text: str
     ):
@@ -624,16 +725,16 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             filename_match = re.search(filename_pattern, user_text, re.IGNORECASE)
             if filename_match:
                 filename = filename_match.group(0)
-                logger.info(f"🔍 Resolviendo document_id por nombre: {filename}")
-                document_id = storage_manager.get_document_id_by_filename(filename)
+                logger.info("🔍 Resolviendo document_id por nombre: %s", filename)
+                document_id = await asyncio.to_thread(storage_manager.get_document_id_by_filename, filename)
 
         # Recuperar análisis
         if document_id:
-            logger.info(f"🔍 Buscando análisis para documento: {document_id}")
-            analysis_list = storage_manager.retrieve_analysis(document_id=document_id)
+            logger.info("🔍 Buscando análisis para documento: %s", document_id)
+            analysis_list = await asyncio.to_thread(storage_manager.retrieve_analysis, document_id=document_id)
         else:
-            logger.info(f"🔍 Buscando todos los análisis")
-            analysis_list = storage_manager.retrieve_analysis(limit=20)
+            logger.info("🔍 Buscando todos los análisis")
+            analysis_list = await asyncio.to_thread(storage_manager.retrieve_analysis, limit=20)
         
         # Preparar respuesta
         if not analysis_list:
@@ -641,12 +742,12 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                 "📭 No se encontraron análisis\n"
                 "\nNo hay análisis almacenados que coincidan con tu búsqueda."
             )
-            json_response = json.dumps({
+            json_response = self.response_formatter.to_json({
                 "status": "success",
                 "operation": "retrieve_analysis",
                 "count": 0,
                 "analysis": []
-            }, indent=2, ensure_ascii=False)
+            })
         else:
             # Generar respuesta en texto plano estructurado
             text_parts = [f"✅ Se encontraron {len(analysis_list)} análisis\n"]
@@ -664,15 +765,15 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                 )
 
             text_response = "\n".join(text_parts)
-            json_response = json.dumps({
+            json_response = self.response_formatter.to_json({
                 "status": "success",
                 "operation": "retrieve_analysis",
                 "count": len(analysis_list),
                 "analysis": analysis_list
-            }, indent=2, ensure_ascii=False)
+            })
 
         # Siempre se ejecuta, sin importar si hay análisis o no
-        await event_queue.enqueue_event(new_agent_text_message(text_response))
+        await updater.enqueue_message(new_agent_text_message(text_response))
         await updater.add_artifact([Part(root=TextPart(text=json_response))])
         
         # Calcular tiempo y guardar métrica:
@@ -683,7 +784,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
     
     async def _handle_get_stats(
     self,
-    updater: TaskUpdater,
+    updater: _QueuedTaskUpdater,
     event_queue: EventQueue,
     user_text: str
     ):
@@ -695,10 +796,10 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             ])
         )
 
-        stats = storage_manager.get_stats()
+        stats = await asyncio.to_thread(storage_manager.get_stats)
 
         if stats["status"] == "error":
-            await event_queue.enqueue_event(new_agent_text_message(
+            await updater.enqueue_message(new_agent_text_message(
                 f"❌ Error obteniendo estadísticas: {stats['message']}"
             ))
             await updater.complete()
@@ -755,8 +856,8 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                 f"{doc_list if doc_list else '  (ninguno)'}"
             )
 
-        await event_queue.enqueue_event(new_agent_text_message(text_response))
-        await updater.add_artifact([Part(root=TextPart(text=json.dumps(stats, indent=2, ensure_ascii=False)))])
+        await updater.enqueue_message(new_agent_text_message(text_response))
+        await updater.add_artifact([Part(root=TextPart(text=self.response_formatter.to_json(stats)))])
         
         # Calcular tiempo y guardar métrica:
         _save_metric("almacenador", "get_stats", "-",
@@ -764,13 +865,13 @@ class AlmacenadorAgentExecutor(AgentExecutor):
         await updater.complete()
 
 
-    async def _handle_get_analyzed_docs(self, updater, event_queue):
+    async def _handle_get_analyzed_docs(self, updater: _QueuedTaskUpdater, event_queue: EventQueue):
         
         start_time = time.time() 
-        result = storage_manager.get_analyzed_documents()
+        result = await asyncio.to_thread(storage_manager.get_analyzed_documents)
 
         if result["status"] == "error":
-            await event_queue.enqueue_event(new_agent_text_message(
+            await updater.enqueue_message(new_agent_text_message(
                 f"❌ Error: {result['message']}"
             ))
             await updater.complete()
@@ -794,7 +895,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
                 f"{doc_list}"
             )
 
-        await event_queue.enqueue_event(new_agent_text_message(text_response))
+        await updater.enqueue_message(new_agent_text_message(text_response))
         
         # Calcular tiempo y guardar métrica:
         _save_metric("almacenador", "get_analyzed_docs", "-",
@@ -806,6 +907,19 @@ class AlmacenadorAgentExecutor(AgentExecutor):
         self, 
         user_parts: List[Part],
         custom_filename: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Procesa archivos PDF de la solicitud sin bloquear el event loop.
+        La decodificación, validación y extracción de texto (CPU intensivas)
+        se ejecutan en un hilo de trabajo mediante asyncio.to_thread.
+        """
+        return await asyncio.to_thread(self._process_pdf_files_sync, user_parts, custom_filename)
+    
+    
+    def _process_pdf_files_sync(
+        self, 
+        user_parts: List[Part],
+        custom_filename: Optional[str] = None
     ) -> Optional[dict]:
         """
         Procesa archivos PDF de la solicitud.
@@ -816,72 +930,94 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             custom_filename: Nombre personalizado proporcionado por el usuario
         
         Returns:
-            dict: {'text': str, 'filename': str, 'metadata': dict} o None
+            dict: {'text': str, 'filename': str, 'metadata': dict, 'content_hash': str} o None
         """
-        for part in user_parts:
-            if isinstance(part, Part):
-                root = getattr(part, 'root', None)
+        # Las partes se clasifican en una sola pasada; aquí solo interesan los archivos
+        _, files = _classify_parts(user_parts)
+        
+        for file_obj in files:
+            file_name = ""
+            file_content = None
+            
+            if isinstance(file_obj, FileWithUri):
+                file_name = file_obj.uri.split('/')[-1]
+                logger.warning("⚠️ FileWithUri detectado: %s. Necesita implementación de descarga.", file_name)
+                continue
+            
+            elif isinstance(file_obj, FileWithBytes):
+                # Obtener nombre original del archivo
+                original_filename = file_obj.name or 'archivo.pdf'
+                file_bytes = file_obj.bytes
                 
-                if isinstance(root, FilePart):
-                    file_obj = getattr(root, 'file', None)
-                    
-                    if file_obj:
-                        file_name = ""
-                        file_content = None
-                        
-                        if isinstance(file_obj, FileWithUri):
-                            file_name = getattr(file_obj, 'uri', 'archivo.pdf').split('/')[-1]
-                            logger.warning(f"⚠️ FileWithUri detectado: {file_name}. Necesita implementación de descarga.")
+                # DECISIÓN: ¿Usar nombre personalizado o nombre original?
+                if custom_filename:
+                    # El usuario especificó un nombre personalizado
+                    file_name = custom_filename
+                    logger.info("📝 Usando nombre personalizado: '%s'", file_name)
+                else:
+                    # Usar nombre original del archivo
+                    file_name = original_filename
+                    logger.info("📝 Usando nombre original: '%s'", file_name)
+                
+                # Se decodifica una sola vez: el mismo buffer se comparte con la
+                # validación, el hash, los metadatos y la extracción de texto
+                # (io.BytesIO sobre un bytes reutiliza su memoria sin copiarla)
+                if file_bytes:
+                    if isinstance(file_bytes, str):
+                        try:
+                            # validate=True rechaza los caracteres fuera del alfabeto
+                            # en lugar de descartarlos en silencio; antes se quitan
+                            # los saltos de línea del base64 estilo MIME (cada 76 caracteres)
+                            file_content = _base64.b64decode(
+                                file_bytes.translate(_BASE64_LINE_BREAKS), validate=True
+                            )
+                        except (binascii.Error, ValueError):
+                            # Si no es base64 tampoco es un PDF: se descarta
+                            logger.error("❌ El archivo '%s' no contiene base64 válido", file_name)
                             continue
+                    else:
+                        file_content = file_bytes
+            
+            # Solo se pasa a minúsculas la extensión, no el nombre completo
+            if file_name[-4:].lower() == '.pdf' and file_content:
+                try:
+                    if not validate_pdf_content(file_content):
+                        logger.warning("⚠️ El archivo '%s' no es un PDF válido", file_name)
+                        continue
+                    
+                    # Un PDF idéntico ya procesado reutiliza su extracción
+                    content_hash = pdf_content_hash(file_content)
+                    cached_pdf = get_cached_pdf(content_hash)
+                    if cached_pdf and cached_pdf.get('text'):
+                        logger.info("♻️ PDF '%s' ya procesado previamente, se reutiliza su texto", file_name)
+                        return {
+                            'filename': file_name,
+                            'text': cached_pdf['text'],
+                            'metadata': cached_pdf['metadata'],
+                            'content_hash': content_hash
+                        }
+                    
+                    metadata = get_pdf_metadata(file_content)
+                    logger.debug("📊 Metadatos del PDF: %r", metadata)
+                    
+                    text = self.pdf_processor.extract_text_from_pdf(file_content)
+                    
+                    if text and text.strip():
+                        logger.info("✅ Texto extraído de '%s': %d caracteres", file_name, len(text))
+                        # El texto por página ya está en 'text': no se retiene dos veces
+                        cache_pdf(content_hash, text=text, metadata=metadata, page_texts=None)
+                        return {
+                            'filename': file_name,
+                            'text': text,
+                            'metadata': metadata,
+                            'content_hash': content_hash
+                        }
+                    else:
+                        logger.warning("⚠️ No se pudo extraer texto de '%s'", file_name)
                         
-                        elif isinstance(file_obj, FileWithBytes):
-                            # Obtener nombre original del archivo
-                            original_filename = getattr(file_obj, 'filename', 'archivo.pdf')
-                            file_bytes = getattr(file_obj, 'bytes', None)
-                            
-                            # DECISIÓN: ¿Usar nombre personalizado o nombre original?
-                            if custom_filename:
-                                # El usuario especificó un nombre personalizado
-                                file_name = custom_filename
-                                logger.info(f"📝 Usando nombre personalizado: '{file_name}'")
-                            else:
-                                # Usar nombre original del archivo
-                                file_name = original_filename
-                                logger.info(f"📝 Usando nombre original: '{file_name}'")
-                            
-                            if file_bytes:
-                                if isinstance(file_bytes, str):
-                                    try:
-                                        file_content = base64.b64decode(file_bytes)
-                                    except:
-                                        file_content = file_bytes.encode('utf-8')
-                                else:
-                                    file_content = file_bytes
-                        
-                        if file_name.lower().endswith('.pdf') and file_content:
-                            try:
-                                if not validate_pdf_content(file_content):
-                                    logger.warning(f"⚠️ El archivo '{file_name}' no es un PDF válido")
-                                    continue
-                                
-                                metadata = get_pdf_metadata(file_content)
-                                logger.info(f"📊 Metadatos del PDF: {metadata}")
-                                
-                                text = self.pdf_processor.extract_text_from_pdf(file_content)
-                                
-                                if text and text.strip():
-                                    logger.info(f"✅ Texto extraído de '{file_name}': {len(text)} caracteres")
-                                    return {
-                                        'filename': file_name,
-                                        'text': text,
-                                        'metadata': metadata
-                                    }
-                                else:
-                                    logger.warning(f"⚠️ No se pudo extraer texto de '{file_name}'")
-                                    
-                            except Exception as e:
-                                logger.error(f"❌ Error procesando PDF '{file_name}': {str(e)}")
-                                raise ValueError(f"Error al procesar PDF: {str(e)}")
+                except Exception as e:
+                    logger.error("❌ Error procesando PDF '%s': %s", file_name, e)
+                    raise ValueError(f"Error al procesar PDF: {str(e)}")
         
         return None
     
@@ -907,7 +1043,7 @@ class AlmacenadorAgentExecutor(AgentExecutor):
             ))
             
         except Exception as e:
-            logger.error(f"❌ Error al cancelar: {str(e)}")
+            logger.error("❌ Error al cancelar: %s", e)
             raise ServerError(error=UnsupportedOperationError(
                 details=f"Cancelación fallida: {str(e)}"
             ))
\ No newline at end of file
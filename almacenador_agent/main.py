@@ -6,13 +6,12 @@ Punto de entrada de la aplicación.
 import logging
 import sys
 import os
-import uvicorn
-from a2a.server.apps import A2AStarletteApplication
-from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
-from a2a.types import AgentCapabilities, AgentCard, AgentSkill
+import threading
 from dotenv import load_dotenv
-from almacenador_agent.agent_executor import AlmacenadorAgentExecutor
+
+# Los imports del servidor (a2a, ADK, Qdrant, modelos) se hacen dentro de las
+# funciones: los workers del pool de extracción de PDFs (spawn) vuelven a
+# ejecutar este módulo como __mp_main__ y así no cargan el servidor completo
 
 # Cargar variables de entorno
 load_dotenv()
@@ -35,6 +34,8 @@ def create_agent_card(public_url=None):
     Returns:
         AgentCard: Tarjeta de configuración del agente
     """
+    from a2a.types import AgentCapabilities, AgentCard, AgentSkill
+    
     try:
         capabilities = AgentCapabilities(streaming=True, push_notifications=True)
         skill_extract = AgentSkill(
@@ -155,10 +156,33 @@ def create_agent_card(public_url=None):
         raise
 
 
+def warmup_models():
+    """
+    Abre la conexión a Qdrant y precarga los modelos de embeddings
+    (almacenamiento y chunking semántico) para que la primera petición
+    no pague su carga.
+    """
+    from almacenador_agent.qdrant_storage import storage_manager
+    from almacenador_agent.tools_agent import PDFProcessor
+    
+    try:
+        if storage_manager.available:
+            storage_manager.warmup()
+        PDFProcessor.warmup()
+    except Exception as e:
+        logger.warning(f'⚠️ No se pudieron precargar los modelos: {e}')
+
+
 def main():
     """
     Función principal que inicia el servidor del agente.
     """
+    import uvicorn
+    from a2a.server.apps import A2AStarletteApplication
+    from a2a.server.request_handlers import DefaultRequestHandler
+    from a2a.server.tasks import InMemoryTaskStore
+    from almacenador_agent.agent_executor import AlmacenadorAgentExecutor
+    
     try:
         # Obtener configuración del servidor
         host = os.getenv('HOST', '0.0.0.0')
@@ -186,6 +210,10 @@ def main():
             http_handler=request_handler
         )
 
+        # Precargar los modelos en segundo plano: el servidor empieza a escuchar
+        # de inmediato y las peticiones que lleguen antes esperan a la misma carga
+        threading.Thread(target=warmup_models, name="warmup", daemon=True).start()
+
         # Iniciar el servidor
         logger.info(f"🚀 Iniciando el servidor almacenador_agent")
         logger.info(f"📍 Servidor escuchando en: http://{host}:{port}")
@@ -9,17 +9,210 @@ VERSIÓN MEJORADA:
 import logging
 import uuid
 import hashlib
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Union
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from qdrant_client.models import Filter, FieldCondition, MatchValue
 import os
+import threading
+import time
+import httpx
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Pool de conexiones HTTP keep-alive compartido por todas las llamadas a Qdrant
+QDRANT_MAX_CONNECTIONS = int(os.getenv("QDRANT_MAX_CONNECTIONS", "32"))
+QDRANT_MAX_KEEPALIVE = int(os.getenv("QDRANT_MAX_KEEPALIVE", "16"))
+
+# upsert/search viajan por gRPC (protobuf binario) en lugar de JSON sobre REST
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() in ("1", "true", "yes")
+# Canales gRPC del pool: las subidas en paralelo no comparten un único canal
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL", str(QDRANT_MAX_CONNECTIONS)))
+
+# Búsqueda sobre vectores cuantizados: se toman el doble de candidatos y se
+# reordenan con los vectores originales para conservar el recall
+SEARCH_PARAMS = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+# Campos del payload por los que se filtra u ordena en cada colección. Se indexan
+# para que los filtros usen el índice en lugar de un full-scan: keyword para los
+# identificadores e integer para las posiciones (permite rangos y order_by)
+_KEYWORD = models.PayloadSchemaType.KEYWORD
+_INTEGER = models.PayloadSchemaType.INTEGER
+DOCUMENT_INDEXED_FIELDS = {
+    "document_id": _KEYWORD,
+    "document_hash": _KEYWORD,
+    "filename": _KEYWORD,
+    "chunk_index": _INTEGER,
+}
+ANALYSIS_INDEXED_FIELDS = {
+    "document_id": _KEYWORD,
+    "analysis_type": _KEYWORD,
+    "analysis_id": _KEYWORD,
+    "analysis_chunk_idx": _INTEGER,
+}
+
+# Cuantización escalar int8 de los vectores en RAM (~4x menos memoria); los
+# originales en float32 quedan en disco para el reordenamiento (ver SEARCH_PARAMS)
+QUANTIZATION_CONFIG = models.ScalarQuantization(
+    scalar=models.ScalarQuantizationConfig(
+        type=models.ScalarType.INT8,
+        quantile=0.99,
+        always_ram=True
+    )
+)
+
+# Grafo HNSW: m=16 vecinos por nodo y algo más de esfuerzo de construcción que
+# el valor por defecto (100) para mejorar el recall de los vectores cuantizados
+HNSW_CONFIG = models.HnswConfigDiff(m=16, ef_construct=128)
+
+# Los análisis más largos se reparten en varios puntos que comparten analysis_id
+ANALYSIS_CHUNK_SIZE = 8192
+
+# Selecciona un punto por análisis: los de una sola parte (sin analysis_chunk_idx)
+# y la primera parte de los análisis fragmentados
+ANALYSIS_HEAD_CONDITION = FieldCondition(key="analysis_chunk_idx", range=models.Range(gt=0))
+
+# Modelo de embeddings compartido por el proceso: se carga una sola vez aunque
+# haya varios gestores, y los workers creados con fork heredan los pesos ya cargados
+_embedding_model = None
+_embedding_model_loaded = False
+# Serializa la carga perezosa del modelo de embeddings (warmup vs. primera petición)
+_embedding_model_lock = threading.Lock()
+
+# Textos por mini-batch del modelo en cada llamada a encode()
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBED_BATCH", "64"))
+
+# Dispositivo del modelo de embeddings ("cuda", "cpu"...); vacío = autodetectar
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "")
+# Hilos de torch en CPU; vacío = el valor por defecto de torch (núcleos físicos)
+TORCH_THREADS = os.getenv("TORCH_THREADS", "")
+
+
+def _select_embedding_device() -> str:
+    """
+    Elige dónde ejecutar el modelo de embeddings: la GPU si hay CUDA, si no la CPU.
+    
+    En CPU aplica TORCH_THREADS si está definido.
+    """
+    try:
+        import torch
+    except ImportError:
+        return EMBEDDING_DEVICE or "cpu"
+    
+    device = EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+    if device == "cpu" and TORCH_THREADS:
+        torch.set_num_threads(int(TORCH_THREADS))
+    return device
+
+
+class _FastEmbedModel:
+    """
+    Adaptador de fastembed (ONNX Runtime) con la interfaz encode() de SentenceTransformer.
+    
+    Mismo modelo y dimensión (all-MiniLM-L6-v2, 384), pero en CPU los kernels
+    de ONNX Runtime son varias veces más rápidos que el forward de PyTorch.
+    """
+    
+    def __init__(self, model_name: str):
+        from fastembed import TextEmbedding
+        self._model = TextEmbedding(model_name=model_name)
+    
+    def encode(self, texts, batch_size: int = EMBEDDING_BATCH_SIZE, **kwargs):
+        single = isinstance(texts, str)
+        vectors = np.asarray(
+            list(self._model.embed([texts] if single else texts, batch_size=batch_size)),
+            dtype=np.float32
+        )
+        return vectors[0] if single else vectors
+
+
+def get_embedding_model():
+    """
+    Devuelve el modelo de embeddings del proceso, cargándolo en la primera llamada.
+    
+    Importar sentence-transformers arrastra torch, así que se difiere hasta
+    que hace falta para no alargar el arranque del servidor.
+    
+    Returns:
+        SentenceTransformer (o su equivalente de fastembed) o None si no
+        hay ninguna de las dos dependencias instalada
+    """
+    global _embedding_model, _embedding_model_loaded
+    if _embedding_model is None and not _embedding_model_loaded:
+        with _embedding_model_lock:
+            if _embedding_model is None and not _embedding_model_loaded:
+                logger.info("🤖 Cargando modelo de embeddings (all-MiniLM-L6-v2)...")
+                device = _select_embedding_device()
+                model = None
+                if device == "cpu":
+                    # En CPU se prefiere fastembed (ONNX Runtime) si está instalado.
+                    # Cualquier fallo al cargarlo (descarga del modelo, onnxruntime...)
+                    # recurre a SentenceTransformer en lugar de reintentarse en cada llamada
+                    try:
+                        model = _FastEmbedModel('sentence-transformers/all-MiniLM-L6-v2')
+                        logger.info("✅ Modelo de embeddings cargado con fastembed (ONNX Runtime)")
+                    except ImportError:
+                        pass
+                    except Exception as e:
+                        logger.warning(f"⚠️ No se pudo cargar fastembed, se usa SentenceTransformer: {e}")
+                if model is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=device)
+                        if device.startswith("cuda"):
+                            # fp16 en GPU: mitad de memoria y tensor cores
+                            model.half()
+                        logger.info("✅ Modelo de embeddings cargado correctamente en %s", device)
+                    except ImportError:
+                        logger.error(
+                            "❌ sentence-transformers no instalado. "
+                            "Instala con: pip install sentence-transformers"
+                        )
+                _embedding_model = model
+                _embedding_model_loaded = True
+    return _embedding_model
+
+
+# Puntos por upsert: mientras se sube un lote se calculan los embeddings del siguiente
+UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "64"))
+# Upserts sin confirmar de indexado (wait=False) en vuelo a la vez
+UPSERT_WORKERS = int(os.getenv("QDRANT_UPSERT_WORKERS", "4"))
+
+# Caracteres por bloque al codificar el texto de un documento para calcular su hash
+HASH_BLOCK_CHARS = 1 << 20
+
+# Puntos por página al recorrer con scroll todos los chunks de un documento
+SCROLL_PAGE_SIZE = 256
+
+# Segundos durante los que se reutiliza el resultado de get_stats (polling de la UI)
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "5"))
+
+# Caché LRU de resultados de search() por (query, limit, score_threshold):
+# una consulta repetida no vuelve a pasar por el modelo ni por Qdrant
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+_search_cache_lock = threading.Lock()
+
+# Caché de _check_document_exists por document_hash: los reintentos de una
+# subida no vuelven a recorrer Qdrant para comprobar si el documento existe
+EXISTS_CACHE_MAX_ENTRIES = 1024
+EXISTS_CACHE_TTL = float(os.getenv("EXISTS_CACHE_TTL", "60"))
+_exists_cache_lock = threading.Lock()
+
+# Caché LRU de embeddings por hash del texto: reingestar un documento (o chunks
+# repetidos entre documentos) no vuelve a pasar esos textos por el modelo
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+_embedding_cache_lock = threading.Lock()
+
 
 class QdrantStorageManager:
     """
@@ -32,6 +225,15 @@ class QdrantStorageManager:
     - Recuperación de análisis por documento
     """
     
+    # (timestamp monotónico, estadísticas) del último get_stats exitoso
+    _stats_cache = (0.0, None)
+    # (timestamp monotónico, info) del último get_collection_info exitoso
+    _collection_info_cache = (0.0, None)
+    
+    # Modelo de embeddings, cargado perezosamente por _load_embedding_model()
+    _embedding_model = None
+    _embedding_model_loaded = False
+    
     def __init__(self):
         """Inicializa la conexión a Qdrant local (Docker) y crea las colecciones si no existen."""
         try:
@@ -40,19 +242,37 @@ class QdrantStorageManager:
             qdrant_port = int(os.getenv("QDRANT_PORT"))
             self.collection_name = os.getenv("COLLECTION_NAME")
             
-            logger.info(f"🔌 Conectando a Qdrant en {qdrant_host}:{qdrant_port}")
+            logger.info(
+                "🔌 Conectando a Qdrant en %s:%s%s", qdrant_host, qdrant_port,
+                f" (gRPC {QDRANT_GRPC_PORT})" if QDRANT_PREFER_GRPC else ""
+            )
             
-            # Crear cliente de Qdrant para conexión local (Docker)
+            # Crear cliente de Qdrant para conexión local (Docker).
+            # Un único cliente con pool keep-alive se reutiliza en todas las
+            # operaciones, evitando abrir una conexión TCP nueva por llamada.
+            # Con gRPC los vectores se envían en protobuf y no se serializan a JSON.
+            # pool_size y limits son excluyentes en QdrantClient: con gRPC se
+            # dimensiona el pool de canales (y con él el de REST)
+            if QDRANT_PREFER_GRPC:
+                pool_kwargs = {"pool_size": QDRANT_POOL_SIZE}
+            else:
+                pool_kwargs = {"limits": httpx.Limits(
+                    max_connections=QDRANT_MAX_CONNECTIONS,
+                    max_keepalive_connections=QDRANT_MAX_KEEPALIVE
+                )}
             self.client = QdrantClient(
                 host=qdrant_host,
                 port=qdrant_port,
-                timeout=10
+                grpc_port=QDRANT_GRPC_PORT,
+                prefer_grpc=QDRANT_PREFER_GRPC,
+                timeout=30,
+                **pool_kwargs
             )
             
             # Verificar conexión
             try:
                 collections = self.client.get_collections()
-                logger.info(f"✅ Conectado a Qdrant - {len(collections.collections)} colecciones existentes")
+                logger.info("✅ Conectado a Qdrant - %d colecciones existentes", len(collections.collections))
             except Exception as e:
                 logger.error(f"❌ No se pudo conectar a Qdrant: {e}")
                 logger.error("🐳 Asegúrate de que Docker esté corriendo:")
@@ -60,49 +280,28 @@ class QdrantStorageManager:
                 raise
             
             # Crear colección de documentos si no existe
-            if not self.client.collection_exists(self.collection_name):
-                logger.info(f"📦 Creando colección '{self.collection_name}'...")
-                self.client.create_collection(
-                    collection_name=self.collection_name,
-                    vectors_config=models.VectorParams(
-                        size=384,  # Dimensión real de all-MiniLM-L6-v2
-                        distance=models.Distance.COSINE
-                    ),
-                )
-                logger.info(f"✅ Colección '{self.collection_name}' creada exitosamente")
+            if self._ensure_collection(self.collection_name, DOCUMENT_INDEXED_FIELDS):
+                logger.info("✅ Colección '%s' creada exitosamente", self.collection_name)
             else:
-                logger.info(f"✅ Usando colección existente '{self.collection_name}'")
+                logger.info("✅ Usando colección existente '%s'", self.collection_name)
             
             # Crear colección para análisis
             self.analysis_collection = f"{self.collection_name}_analysis"
-            if not self.client.collection_exists(self.analysis_collection):
-                logger.info(f"📦 Creando colección de análisis '{self.analysis_collection}'...")
-                self.client.create_collection(
-                    collection_name=self.analysis_collection,
-                    vectors_config=models.VectorParams(
-                        size=384,  # Dimensión real de all-MiniLM-L6-v2
-                        distance=models.Distance.COSINE
-                    ),
-                )
-                logger.info(f"✅ Colección de análisis creada exitosamente")
+            if self._ensure_collection(self.analysis_collection, ANALYSIS_INDEXED_FIELDS):
+                logger.info("✅ Colección de análisis creada exitosamente")
             
             self.available = True
             
-            # Inicializar modelo de embeddings para vectorización real
-            # Se carga una sola vez y se reutiliza en todas las operaciones
-            logger.info("🤖 Cargando modelo de embeddings (all-MiniLM-L6-v2)...")
-            try:
-                from sentence_transformers import SentenceTransformer
-                self._embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-                self._embedding_size = 384  # Dimensión real del modelo all-MiniLM-L6-v2
-                logger.info("✅ Modelo de embeddings cargado correctamente")
-            except ImportError:
-                logger.error(
-                    "❌ sentence-transformers no instalado. "
-                    "Instala con: pip install sentence-transformers"
-                )
-                self._embedding_model = None
-                self._embedding_size = 768  # Fallback
+            # (query, limit, score_threshold) -> (timestamp monotónico, resultados)
+            self._search_cache = OrderedDict()
+            # blake2b del texto -> vector (ndarray float32)
+            self._embedding_cache = OrderedDict()
+            # document_hash -> (timestamp monotónico, info del documento o None)
+            self._exists_cache = OrderedDict()
+            
+            # El modelo de embeddings (y con él torch) se carga en el primer uso
+            # o en warmup(), no al importar el módulo
+            self._embedding_size = 384  # Dimensión real del modelo all-MiniLM-L6-v2
 
             logger.info("✅ QdrantStorageManager inicializado correctamente")
             
@@ -121,12 +320,136 @@ class QdrantStorageManager:
             self.available = False
     
     
+    def _ensure_collection(self, collection_name: str, indexed_fields: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Crea la colección si todavía no existe.
+        
+        Tolera que otro proceso la cree a la vez (varios workers arrancando
+        juntos): si la creación falla pero la colección ya existe, se usa esa.
+        
+        Returns:
+            bool: True si la colección se creó en esta llamada
+        """
+        if self.client.collection_exists(collection_name):
+            # Colecciones creadas con una configuración anterior: completarla
+            self._upgrade_collection(collection_name, indexed_fields)
+            return False
+        
+        logger.info("📦 Creando colección '%s'...", collection_name)
+        try:
+            self._create_collection(collection_name, indexed_fields)
+        except Exception:
+            # Otro worker la creó entre la comprobación y la creación
+            if self.client.collection_exists(collection_name):
+                logger.info("ℹ️ La colección '%s' fue creada por otro proceso", collection_name)
+                return False
+            raise
+        return True
+    
+    
+    def _upgrade_collection(self, collection_name: str, indexed_fields: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Completa la configuración de una colección creada por una versión anterior.
+        
+        Crea los índices de payload que falten (sin ellos, los filtros por
+        document_hash/document_id recorren la colección entera) y activa la
+        cuantización int8 si la colección no la tiene. Un fallo aquí no impide
+        arrancar: solo se pierde la optimización correspondiente.
+        """
+        try:
+            info = self.client.get_collection(collection_name)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer el esquema de '{collection_name}': {e}")
+            return
+        
+        existing = info.payload_schema or {}
+        for field_name, field_schema in (indexed_fields or {}).items():
+            if field_name in existing:
+                continue
+            try:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+                logger.info("🗂️ Índice de payload '%s' creado en '%s'", field_name, collection_name)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo crear el índice '{field_name}' en '{collection_name}': {e}")
+        
+        if info.config.quantization_config is None:
+            try:
+                self.client.update_collection(
+                    collection_name=collection_name,
+                    quantization_config=QUANTIZATION_CONFIG
+                )
+                logger.info("🗜️ Cuantización int8 activada en '%s'", collection_name)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo activar la cuantización en '{collection_name}': {e}")
+    
+    
+    def _create_collection(self, collection_name: str, indexed_fields: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Crea una colección de vectores con la configuración común del proyecto.
+
+        Los vectores se cuantizan a int8 (cuantización escalar), lo que reduce
+        ~4x la memoria que ocupan en RAM. La búsqueda reordena los candidatos
+        con los vectores originales para no perder precisión (ver SEARCH_PARAMS).
+        Los originales quedan en disco: solo se leen para ese reordenamiento.
+
+        Args:
+            collection_name: Nombre de la colección a crear
+            indexed_fields: Campos del payload a indexar y su tipo de índice
+        """
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(
+                size=384,  # Dimensión real de all-MiniLM-L6-v2
+                distance=models.Distance.COSINE,
+                on_disk=True
+            ),
+            quantization_config=QUANTIZATION_CONFIG,
+            hnsw_config=HNSW_CONFIG,
+        )
+        
+        for field_name, field_schema in (indexed_fields or {}).items():
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema
+            )
+    
+    
+    def _load_embedding_model(self):
+        """
+        Devuelve el modelo de embeddings del proceso (ver get_embedding_model).
+
+        Returns:
+            SentenceTransformer (o su equivalente de fastembed) o None si no
+            hay ninguna de las dos dependencias instalada
+        """
+        if self._embedding_model is None and not self._embedding_model_loaded:
+            self._embedding_model = get_embedding_model()
+            self._embedding_model_loaded = True
+        return self._embedding_model
+    
+    
+    def warmup(self) -> None:
+        """
+        Carga el modelo y calcula un embedding de prueba para que la primera
+        petición no pague la inicialización perezosa (imports, kernels, tokenizador).
+        """
+        if self._load_embedding_model() is not None:
+            self._get_embedding("warmup")
+            logger.info("🔥 Modelo de embeddings precalentado")
+    
+    
     def _get_embedding(self, text: str) -> List[float]:
         """
         Genera un embedding real para el texto dado usando el modelo cargado.
 
-        Si el modelo no está disponible (por falta de dependencias), devuelve
-        un vector de ceros como fallback para no bloquear el flujo.
+        Pasa por _get_embeddings, así que comparte su caché por hash: una
+        consulta repetida no vuelve a ejecutar el modelo. Si el modelo no está
+        disponible devuelve un vector de ceros como fallback.
 
         Args:
             text: Texto a vectorizar
@@ -134,29 +457,83 @@ class QdrantStorageManager:
         Returns:
             List[float]: Vector de embeddings de dimensión 384
         """
-        if self._embedding_model is None:
-            logger.warning("⚠️ Modelo de embeddings no disponible. Usando vector de fallback.")
-            return [0.0] * 384
+        return self._get_embeddings([text])[0]
 
-        try:
-            vector = self._embedding_model.encode(text, show_progress_bar=False)
-            return vector.tolist()
-        except Exception as e:
-            logger.error(f"❌ Error generando embedding: {e}")
-            return [0.0] * 384
+    
+    def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Genera los embeddings de varios textos con una sola llamada al modelo.
+
+        Codificar en lote aprovecha las multiplicaciones matriciales del backend
+        en lugar de pagar el coste de encode() por cada fragmento. Los textos ya
+        vectorizados se sirven desde la caché y solo se codifican los nuevos.
+
+        Args:
+            texts: Textos a vectorizar
+
+        Returns:
+            List[List[float]]: Un vector de dimensión 384 por texto, en el mismo orden
+        """
+        model = self._load_embedding_model()
+        if model is None:
+            logger.warning("⚠️ Modelo de embeddings no disponible. Usando vectores de fallback.")
+            return [[0.0] * 384 for _ in texts]
+
+        keys = [hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest() for text in texts]
+        vectors = [None] * len(texts)
+        with _embedding_cache_lock:
+            for i, key in enumerate(keys):
+                cached = self._embedding_cache.get(key)
+                if cached is not None:
+                    self._embedding_cache.move_to_end(key)
+                    vectors[i] = cached
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            try:
+                encoded = model.encode(
+                    [texts[i] for i in missing], batch_size=EMBEDDING_BATCH_SIZE,
+                    show_progress_bar=False, convert_to_numpy=True
+                )
+            except Exception as e:
+                logger.error(f"❌ Error generando embeddings: {e}")
+                return [[0.0] * 384 for _ in texts]
+            
+            with _embedding_cache_lock:
+                for i, vector in zip(missing, encoded):
+                    vectors[i] = vector
+                    self._embedding_cache[keys[i]] = vector
+                    self._embedding_cache.move_to_end(keys[i])
+                while len(self._embedding_cache) > EMBEDDING_CACHE_MAX_ENTRIES:
+                    self._embedding_cache.popitem(last=False)
+        
+        return [vector.tolist() for vector in vectors]
 
     
-    def _calculate_document_hash(self, content: str) -> str:
+    def _calculate_document_hash(self, content: Union[str, bytes, memoryview]) -> str:
         """
         Calcula un hash único para el contenido del documento.
         
+        Se mantiene SHA-256 porque es el document_hash ya guardado en Qdrant:
+        cambiar de algoritmo rompería la deduplicación de lo almacenado.
+        hashlib delega en OpenSSL, que usa las instrucciones SHA del CPU si existen.
+        
+        El texto se codifica por bloques en lugar de crear una copia UTF-8 del
+        documento entero; el resultado es el mismo hash que el del texto completo.
+        
         Args:
-            content: Contenido completo del documento
+            content: Contenido completo del documento (texto o bytes UTF-8)
             
         Returns:
             str: Hash SHA-256 del documento
         """
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+        if not isinstance(content, str):
+            return hashlib.sha256(content).hexdigest()
+        
+        digest = hashlib.sha256()
+        for start in range(0, len(content), HASH_BLOCK_CHARS):
+            digest.update(content[start:start + HASH_BLOCK_CHARS].encode('utf-8'))
+        return digest.hexdigest()
     
     
     def _check_document_exists(self, doc_hash: str) -> Optional[Dict[str, Any]]:
@@ -172,6 +549,12 @@ class QdrantStorageManager:
         if not self.available:
             return None
         
+        with _exists_cache_lock:
+            cached = self._exists_cache.get(doc_hash)
+            if cached is not None and time.monotonic() - cached[0] < EXISTS_CACHE_TTL:
+                self._exists_cache.move_to_end(doc_hash)
+                return cached[1]
+        
         try:
             # Buscar documentos con el mismo hash
             search_result = self.client.scroll(
@@ -184,12 +567,16 @@ class QdrantStorageManager:
                         )
                     ]
                 ),
-                limit=1
+                limit=1,
+                # Solo los campos que se devuelven: no viaja el contenido del chunk
+                with_payload=["document_id", "stored_at", "filename", "total_chunks"],
+                with_vectors=False
             )
             
+            existing = None
             if search_result[0]:  # Si hay resultados
                 point = search_result[0][0]
-                return {
+                existing = {
                     "exists": True,
                     "document_id": point.payload.get("document_id"),
                     "stored_at": point.payload.get("stored_at"),
@@ -197,13 +584,29 @@ class QdrantStorageManager:
                     "num_chunks": point.payload.get("total_chunks")
                 }
             
-            return None
+            self._cache_document_exists(doc_hash, existing)
+            return existing
             
         except Exception as e:
             logger.error(f"Error verificando existencia del documento: {e}")
             return None
     
     
+    def _cache_document_exists(self, doc_hash: str, existing: Optional[Dict[str, Any]]) -> None:
+        """Guarda el resultado de _check_document_exists para doc_hash."""
+        with _exists_cache_lock:
+            self._exists_cache[doc_hash] = (time.monotonic(), existing)
+            self._exists_cache.move_to_end(doc_hash)
+            while len(self._exists_cache) > EXISTS_CACHE_MAX_ENTRIES:
+                self._exists_cache.popitem(last=False)
+    
+    
+    def _forget_document_exists(self, doc_hash: str) -> None:
+        """Descarta el resultado cacheado de _check_document_exists para doc_hash."""
+        with _exists_cache_lock:
+            self._exists_cache.pop(doc_hash, None)
+    
+    
     def store_chunks(
         self, 
         chunks: List[str], 
@@ -232,28 +635,28 @@ class QdrantStorageManager:
                 "chunks_stored": 0
             }
         
+        doc_hash = None
         try:
             # Generar ID único para este documento
             document_id = str(uuid.uuid4())
             
             # Calcular hash si se proporciona contenido completo
-            doc_hash = None
             existing_doc = None
             was_updated = False
             
             if full_content:
                 doc_hash = self._calculate_document_hash(full_content)
-                logger.info(f"🔍 Hash del documento: {doc_hash[:16]}...")
+                logger.info("🔍 Hash del documento: %s...", doc_hash[:16])
                 
                 # Verificar si ya existe
                 existing_doc = self._check_document_exists(doc_hash)
                 
                 if existing_doc:
-                    logger.info(f"⚠️  Documento duplicado detectado!")
-                    logger.info(f"   - Archivo: {existing_doc.get('filename')}")
-                    logger.info(f"   - Almacenado: {existing_doc.get('stored_at')}")
-                    logger.info(f"   - Chunks: {existing_doc.get('num_chunks')}")
-                    logger.info(f"🔄 Actualizando documento existente...")
+                    logger.info("⚠️  Documento duplicado detectado!")
+                    logger.info("   - Archivo: %s", existing_doc.get('filename'))
+                    logger.info("   - Almacenado: %s", existing_doc.get('stored_at'))
+                    logger.info("   - Chunks: %s", existing_doc.get('num_chunks'))
+                    logger.info("🔄 Actualizando documento existente...")
                     
                     document_id = existing_doc['document_id']
                     was_updated = True
@@ -261,47 +664,78 @@ class QdrantStorageManager:
                     # Eliminar chunks antiguos del documento
                     self._delete_document_chunks(document_id)
             
-            logger.info(f"💾 Preparando {len(chunks)} fragmentos para almacenamiento...")
+            logger.info("💾 Preparando %d fragmentos para almacenamiento...", len(chunks))
             
-            points = []
-            base_metadata = metadata or {}
+            # Solo se conservan los IDs: cada lote de puntos (vectores incluidos)
+            # se libera en cuanto termina su upsert
+            point_ids = []
             timestamp = datetime.utcnow().isoformat()
             
-            for idx, chunk in enumerate(chunks):
-                # Generar ID único para cada punto
-                point_id = str(uuid.uuid4())
+            # Parte común del payload, construida una sola vez: cada punto copia
+            # la plantilla y solo asigna sus campos propios. La longitud del
+            # chunk no se guarda: es len(contenido)
+            payload_template = {
+                "total_chunks": len(chunks),
+                "document_id": document_id,
+                "document_hash": doc_hash,
+                "filename": filename or "unknown.pdf",
+                "stored_at": timestamp,
+                "updated_at": timestamp if was_updated else None,
+            }
+            payload_template.update(metadata or {})
+            
+            # Los embeddings de cada lote se calculan mientras los anteriores se
+            # suben en paralelo con wait=False (Qdrant confirma al escribir el WAL,
+            # sin esperar al indexado). Cada lote se envía en cuanto está listo,
+            # salvo el último (se sabe cuál es por el número de chunks): se envía
+            # con wait=True cuando los demás están confirmados, y como Qdrant
+            # aplica las operaciones en orden, al volver todo el documento es visible.
+            # Como mucho hay UPSERT_WORKERS + 1 lotes en memoria.
+            last_batch = None
+            with ThreadPoolExecutor(max_workers=UPSERT_WORKERS, thread_name_prefix="qdrant-upsert") as uploader:
+                in_flight = deque()
                 
-                # Generar embedding real del chunk para búsqueda semántica
-                chunk_vector = self._get_embedding(chunk)
+                for batch in self._iter_point_batches(chunks, payload_template):
+                    point_ids.extend(batch.ids)
+                    
+                    if len(point_ids) == len(chunks):
+                        last_batch = batch
+                        break
+                    
+                    # Limitar los lotes en vuelo (propaga los errores de los anteriores)
+                    if len(in_flight) >= UPSERT_WORKERS:
+                        in_flight.popleft().result()
+                    logger.info("📤 Subiendo %d puntos a Qdrant (%d/%d)...", len(batch.ids), len(point_ids), len(chunks))
+                    in_flight.append(uploader.submit(
+                        self.client.upsert,
+                        collection_name=self.collection_name,
+                        points=batch,
+                        wait=False
+                    ))
                 
-                # Crear punto con payload completo
-                point = models.PointStruct(
-                    id=point_id,
-                    vector=chunk_vector,
-                    payload={
-                        "contenido": chunk,
-                        "chunk_index": idx,
-                        "total_chunks": len(chunks),
-                        "chunk_length": len(chunk),
-                        "document_id": document_id,
-                        "document_hash": doc_hash,
-                        "filename": filename or "unknown.pdf",
-                        "stored_at": timestamp,
-                        "updated_at": timestamp if was_updated else None,
-                        **base_metadata
-                    }
-                )
-                points.append(point)
+                for upload in in_flight:
+                    upload.result()
             
-            # Almacenar todos los puntos en Qdrant
-            logger.info(f"📤 Subiendo {len(points)} puntos a Qdrant...")
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
+            if last_batch is not None:
+                logger.info("📤 Subiendo %d puntos a Qdrant (%d/%d)...", len(last_batch.ids), len(point_ids), len(chunks))
+                self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=last_batch
+                )
+            self._invalidate_stats_cache()
+            self._invalidate_search_cache()
+            if doc_hash:
+                # El documento ya existe: un reintento lo detecta sin consultar Qdrant
+                self._cache_document_exists(doc_hash, {
+                    "exists": True,
+                    "document_id": document_id,
+                    "stored_at": timestamp,
+                    "filename": payload_template["filename"],
+                    "num_chunks": len(chunks)
+                })
             
             action = "actualizados" if was_updated else "almacenados"
-            logger.info(f"✅ {len(chunks)} fragmentos {action} exitosamente en '{self.collection_name}'")
+            logger.info("✅ %d fragmentos %s exitosamente en '%s'", len(chunks), action, self.collection_name)
             
             return {
                 "status": "success",
@@ -310,12 +744,16 @@ class QdrantStorageManager:
                 "document_id": document_id,
                 "document_hash": doc_hash,
                 "was_updated": was_updated,
-                "point_ids": [p.id for p in points],
+                "point_ids": point_ids,
                 "existing_doc_info": existing_doc if existing_doc else None
             }
             
         except Exception as e:
             logger.error(f"❌ Error almacenando fragmentos en Qdrant: {e}", exc_info=True)
+            if doc_hash:
+                # Algunos lotes (wait=False) pueden haberse escrito: el reintento
+                # debe consultar Qdrant y no fiarse de un "no existe" cacheado
+                self._forget_document_exists(doc_hash)
             return {
                 "status": "error",
                 "message": f"Error de almacenamiento: {str(e)}",
@@ -323,10 +761,55 @@ class QdrantStorageManager:
             }
     
     
+    def _iter_point_batches(
+        self,
+        chunks: List[str],
+        payload_template: Dict[str, Any]
+    ) -> Iterator[models.Batch]:
+        """
+        Genera los lotes de puntos de un documento bajo demanda.
+        
+        Cada lote (UPSERT_BATCH_SIZE chunks) se vectoriza al pedirlo, de modo
+        que en memoria solo viven los lotes pendientes de subir y no todos los
+        puntos del documento.
+        
+        Args:
+            chunks: Fragmentos del documento
+            payload_template: Campos comunes del payload de todos los puntos
+            
+        Yields:
+            models.Batch: Lote columnar con ids, vectores y payloads
+        """
+        for batch_start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+            batch_chunks = chunks[batch_start:batch_start + UPSERT_BATCH_SIZE]
+            # Embeddings reales del lote completo en una sola llamada al modelo
+            batch_vectors = self._get_embeddings(batch_chunks)
+            
+            # UUID4 para todo el lote con una sola lectura de os.urandom, en el
+            # formato canónico con guiones que Qdrant devuelve en las búsquedas
+            raw_ids = os.urandom(16 * len(batch_chunks))
+            batch_ids = [str(uuid.UUID(bytes=raw_ids[i:i + 16], version=4)) for i in range(0, len(raw_ids), 16)]
+            
+            batch_payloads = []
+            for offset, chunk in enumerate(batch_chunks):
+                payload = payload_template.copy()
+                payload["contenido"] = chunk
+                payload["chunk_index"] = batch_start + offset
+                batch_payloads.append(payload)
+            
+            # Lote columnar (ids, vectores y payloads en listas paralelas): un solo
+            # modelo en lugar de un PointStruct por chunk. Los datos los genera este
+            # método, así que se omite la validación de pydantic float a float
+            yield models.Batch.model_construct(ids=batch_ids, vectors=batch_vectors, payloads=batch_payloads)
+    
+    
     def _delete_document_chunks(self, document_id: str) -> bool:
         """
         Elimina todos los chunks de un documento específico.
         
+        El borrado se hace por filtro en el servidor (apoyado en el índice de
+        document_id): un solo viaje, sin traer antes los IDs de los puntos.
+        
         Args:
             document_id: ID del documento a eliminar
             
@@ -334,33 +817,23 @@ class QdrantStorageManager:
             bool: True si se eliminó correctamente
         """
         try:
-            # Obtener todos los puntos del documento
-            scroll_result = self.client.scroll(
+            self.client.delete(
                 collection_name=self.collection_name,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="document_id",
-                            match=MatchValue(value=document_id)
-                        )
-                    ]
-                ),
-                limit=1000
-            )
-            
-            point_ids = [point.id for point in scroll_result[0]]
-            
-            if point_ids:
-                self.client.delete(
-                    collection_name=self.collection_name,
-                    points_selector=models.PointIdsList(
-                        points=point_ids
+                points_selector=models.FilterSelector(
+                    filter=Filter(
+                        must=[
+                            FieldCondition(
+                                key="document_id",
+                                match=MatchValue(value=document_id)
+                            )
+                        ]
                     )
                 )
-                logger.info(f"🗑️  Eliminados {len(point_ids)} chunks antiguos del documento")
-                return True
-            
-            return False
+            )
+            self._invalidate_stats_cache()
+            self._invalidate_search_cache()
+            logger.info("🗑️  Eliminados los chunks antiguos del documento %s", document_id)
+            return True
             
         except Exception as e:
             logger.error(f"Error eliminando chunks del documento: {e}")
@@ -397,33 +870,59 @@ class QdrantStorageManager:
         try:
             analysis_id = str(uuid.uuid4())
             timestamp = datetime.utcnow().isoformat()
-            
-            # Generar embedding real del contenido del análisis
-            analysis_vector = self._get_embedding(analysis_content)
-            
             base_metadata = metadata or {}
             
-            point = models.PointStruct(
-                id=analysis_id,
-                vector=analysis_vector,
-                payload={
-                    "analysis_content": analysis_content,
-                    "document_id": document_id,
-                    "analysis_type": analysis_type,
-                    "created_at": timestamp,
-                    "content_length": len(analysis_content),
-                    "filename": filename,
-                    **base_metadata
+            # Los análisis grandes se dividen en partes consecutivas (sin solapamiento,
+            # para reconstruirlos exactamente). La primera parte usa analysis_id como id
+            parts = [
+                analysis_content[start:start + ANALYSIS_CHUNK_SIZE]
+                for start in range(0, len(analysis_content), ANALYSIS_CHUNK_SIZE)
+            ]
+            if not parts:
+                logger.warning("⚠️ Análisis vacío para documento %s..., no se almacena", document_id[:8])
+                return {
+                    "status": "error",
+                    "message": "El contenido del análisis está vacío",
+                    "analysis_stored": False
                 }
-            )
+            
+            # Embeddings reales de todas las partes en una sola llamada al modelo
+            part_vectors = self._get_embeddings(parts)
+            
+            # Parte común del payload, construida una sola vez como en store_chunks
+            payload_template = {
+                "document_id": document_id,
+                "analysis_type": analysis_type,
+                "created_at": timestamp,
+                "content_length": len(analysis_content),
+                "filename": filename,
+                **base_metadata
+            }
+            if len(parts) > 1:
+                payload_template["analysis_id"] = analysis_id
+                payload_template["analysis_total_chunks"] = len(parts)
+            
+            points = []
+            for part_idx, (part, part_vector) in enumerate(zip(parts, part_vectors)):
+                payload = payload_template.copy()
+                payload["analysis_content"] = part
+                if len(parts) > 1:
+                    payload["analysis_chunk_idx"] = part_idx
+                
+                points.append(models.PointStruct(
+                    id=analysis_id if part_idx == 0 else str(uuid.uuid4()),
+                    vector=part_vector,
+                    payload=payload
+                ))
             
             # Almacenar en la colección de análisis
             self.client.upsert(
                 collection_name=self.analysis_collection,
-                points=[point]
+                points=points
             )
+            self._invalidate_stats_cache()
             
-            logger.info(f"✅ Análisis '{analysis_type}' almacenado para documento {document_id[:8]}...")
+            logger.info("✅ Análisis '%s' almacenado para documento %s...", analysis_type, document_id[:8])
             
             return {
                 "status": "success",
@@ -431,6 +930,7 @@ class QdrantStorageManager:
                 "analysis_id": analysis_id,
                 "document_id": document_id,
                 "analysis_type": analysis_type,
+                "analysis_chunks": len(points),
                 "collection": self.analysis_collection
             }
             
@@ -484,35 +984,37 @@ class QdrantStorageManager:
                     )
                 )
             
-            # Realizar búsqueda
-            if filters:
-                scroll_result = self.client.scroll(
-                    collection_name=self.analysis_collection,
-                    scroll_filter=Filter(must=filters),
-                    limit=limit
-                )
-            else:
-                scroll_result = self.client.scroll(
-                    collection_name=self.analysis_collection,
-                    limit=limit
-                )
+            # Realizar búsqueda (un punto por análisis; las partes extra se cargan después)
+            scroll_result = self.client.scroll(
+                collection_name=self.analysis_collection,
+                scroll_filter=Filter(must=filters or None, must_not=[ANALYSIS_HEAD_CONDITION]),
+                limit=limit
+            )
             
             results = []
             for point in scroll_result[0]:
+                analysis_content = point.payload.get("analysis_content")
+                total_parts = point.payload.get("analysis_total_chunks", 1)
+                if total_parts > 1:
+                    analysis_content = self._load_analysis_content(point.id, total_parts)
+                
                 results.append({
                     "analysis_id": point.id,
                     "document_id": point.payload.get("document_id"),
                     "filename": point.payload.get("filename", "No disponible"),
                     "analysis_type": point.payload.get("analysis_type"),
-                    "analysis_content": point.payload.get("analysis_content"),
+                    "analysis_content": analysis_content,
                     "created_at": point.payload.get("created_at"),
                     "metadata": {
                         k: v for k, v in point.payload.items()
-                        if k not in ["analysis_content", "document_id", "analysis_type", "created_at"]
+                        if k not in [
+                            "analysis_content", "document_id", "analysis_type", "created_at",
+                            "analysis_id", "analysis_chunk_idx", "analysis_total_chunks"
+                        ]
                     }
                 })
             
-            logger.info(f"🔍 Encontrados {len(results)} análisis")
+            logger.info("🔍 Encontrados %d análisis", len(results))
             return results
             
         except Exception as e:
@@ -520,6 +1022,29 @@ class QdrantStorageManager:
             return []
     
     
+    def _load_analysis_content(self, analysis_id: str, total_parts: int) -> str:
+        """
+        Reconstruye el contenido de un análisis almacenado en varias partes.
+        
+        Args:
+            analysis_id: ID compartido por todas las partes del análisis
+            total_parts: Número de partes con que se almacenó
+            
+        Returns:
+            str: Contenido completo del análisis
+        """
+        parts_result = self.client.scroll(
+            collection_name=self.analysis_collection,
+            scroll_filter=Filter(must=[
+                FieldCondition(key="analysis_id", match=MatchValue(value=analysis_id))
+            ]),
+            limit=total_parts,
+            with_payload=["analysis_content", "analysis_chunk_idx"]
+        )
+        parts = sorted(parts_result[0], key=lambda p: p.payload.get("analysis_chunk_idx", 0))
+        return "".join(p.payload.get("analysis_content", "") for p in parts)
+    
+    
     def get_document_with_analysis(self, document_id: str) -> Dict[str, Any]:
         """
         Recupera un documento junto con todos sus análisis.
@@ -537,39 +1062,49 @@ class QdrantStorageManager:
             }
         
         try:
-            # Obtener chunks del documento
-            doc_chunks = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="document_id",
-                            match=MatchValue(value=document_id)
-                        )
-                    ]
-                ),
-                limit=1000
-            )
-            
-            # Obtener análisis del documento
-            analysis_list = self.retrieve_analysis(document_id=document_id)
+            # Los análisis se piden en paralelo con los chunks: las dos consultas
+            # a Qdrant se solapan en lugar de encadenar sus viajes de red
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="qdrant-analysis") as executor:
+                analysis_future = executor.submit(self.retrieve_analysis, document_id=document_id)
+                
+                # Obtener chunks del documento, paginando con el cursor de scroll
+                # para no truncar documentos de más de una página
+                doc_points = []
+                offset = None
+                while True:
+                    page, offset = self.client.scroll(
+                        collection_name=self.collection_name,
+                        scroll_filter=Filter(
+                            must=[
+                                FieldCondition(
+                                    key="document_id",
+                                    match=MatchValue(value=document_id)
+                                )
+                            ]
+                        ),
+                        limit=SCROLL_PAGE_SIZE,
+                        offset=offset,
+                        with_payload=["chunk_index", "contenido", "filename", "stored_at", "document_hash"],
+                        with_vectors=False
+                    )
+                    doc_points.extend(page)
+                    if offset is None:
+                        break
+                
+                analysis_list = analysis_future.result()
             
-            if not doc_chunks[0]:
+            if not doc_points:
                 return {
                     "status": "error",
                     "message": f"Documento {document_id} no encontrado"
                 }
             
-            # Reconstruir documento
-            chunks_data = sorted(
-                [(p.payload.get("chunk_index"), p.payload.get("contenido")) 
-                 for p in doc_chunks[0]],
-                key=lambda x: x[0]
-            )
-            
-            full_content = "\n".join([chunk[1] for chunk in chunks_data])
+            # Reconstruir documento: se ordenan los propios puntos en su sitio,
+            # sin listas intermedias de tuplas (índice, contenido)
+            doc_points.sort(key=lambda p: p.payload.get("chunk_index", 0))
+            full_content = "\n".join([p.payload.get("contenido") for p in doc_points])
             
-            first_chunk = doc_chunks[0][0]
+            first_chunk = doc_points[0]
             
             return {
                 "status": "success",
@@ -577,7 +1112,7 @@ class QdrantStorageManager:
                     "document_id": document_id,
                     "filename": first_chunk.payload.get("filename"),
                     "content": full_content,
-                    "num_chunks": len(doc_chunks[0]),
+                    "num_chunks": len(doc_points),
                     "stored_at": first_chunk.payload.get("stored_at"),
                     "document_hash": first_chunk.payload.get("document_hash")
                 },
@@ -614,43 +1149,149 @@ class QdrantStorageManager:
             logger.warning("⚠️ Búsqueda no disponible - Qdrant no conectado")
             return []
         
+        query = self._normalize_query(query)
+        cache_key = (query, limit, score_threshold)
+        with _search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < SEARCH_CACHE_TTL:
+                self._search_cache.move_to_end(cache_key)
+                logger.debug("🔍 Resultado de búsqueda servido desde caché")
+                return self._copy_hits(cached[1])
+        
         try:
             # Generar embedding real de la consulta para búsqueda semántica genuina
             query_vector = self._get_embedding(query)
             
-            results = self.client.search(
+            results = self.client.query_points(
                 collection_name=self.collection_name,
-                query_vector=query_vector,
+                query=query_vector,
                 limit=limit,
-                score_threshold=score_threshold
+                score_threshold=score_threshold,
+                search_params=SEARCH_PARAMS,
+                with_payload=True
+            ).points
+            
+            logger.info("🔍 Encontrados %d resultados para la búsqueda", len(results))
+            
+            hits = [self._format_hit(hit) for hit in results]
+            
+            with _search_cache_lock:
+                self._search_cache[cache_key] = (time.monotonic(), hits)
+                self._search_cache.move_to_end(cache_key)
+                while len(self._search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+                    self._search_cache.popitem(last=False)
+            return self._copy_hits(hits)
+            
+        except Exception as e:
+            logger.error(f"❌ Error en búsqueda: {e}", exc_info=True)
+            return []
+    
+    
+    def search_many(
+        self,
+        queries: List[str],
+        limit: int = 5,
+        score_threshold: float = 0.5
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca fragmentos similares para varias consultas a la vez.
+        
+        Las consultas se vectorizan con una sola llamada al modelo y se envían
+        a Qdrant en una única petición batch, en lugar de un viaje por consulta.
+        
+        Args:
+            queries: Textos de búsqueda
+            limit: Número máximo de resultados por consulta
+            score_threshold: Umbral mínimo de similitud (0-1)
+            
+        Returns:
+            Una lista de resultados por consulta, en el mismo orden que queries
+        """
+        if not self.available:
+            logger.warning("⚠️ Búsqueda no disponible - Qdrant no conectado")
+            return [[] for _ in queries]
+        
+        if not queries:
+            return []
+        
+        try:
+            query_vectors = self._get_embeddings([self._normalize_query(q) for q in queries])
+            
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    models.QueryRequest(
+                        query=vector,
+                        limit=limit,
+                        score_threshold=score_threshold,
+                        params=SEARCH_PARAMS,
+                        with_payload=True
+                    )
+                    for vector in query_vectors
+                ]
             )
             
-            logger.info(f"🔍 Encontrados {len(results)} resultados para la búsqueda")
+            logger.info("🔍 Búsqueda batch de %d consultas completada", len(queries))
             
             return [
-                {
-                    "id": hit.id,
-                    "score": hit.score,
-                    "contenido": hit.payload.get("contenido", ""),
-                    "document_id": hit.payload.get("document_id"),
-                    "filename": hit.payload.get("filename"),
-                    "metadata": {
-                        k: v for k, v in hit.payload.items() 
-                        if k not in ["contenido", "document_id", "filename"]
-                    }
-                }
-                for hit in results
+                [self._format_hit(hit) for hit in response.points]
+                for response in responses
             ]
             
         except Exception as e:
-            logger.error(f"❌ Error en búsqueda: {e}", exc_info=True)
-            return []
+            logger.error(f"❌ Error en búsqueda batch: {e}", exc_info=True)
+            return [[] for _ in queries]
+    
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """
+        Normaliza una consulta para reutilizar su embedding y sus resultados en caché.
+        
+        all-MiniLM-L6-v2 usa un tokenizador uncased que ignora los espacios
+        repetidos, así que pasar a minúsculas y colapsar espacios no cambia el
+        vector: "Plazo de pago " y "plazo de  pago" comparten entrada.
+        """
+        return " ".join(query.split()).lower()
+    
+    
+    @staticmethod
+    def _format_hit(hit) -> Dict[str, Any]:
+        """
+        Convierte un punto devuelto por Qdrant en el dict de resultado de búsqueda.
+        
+        El payload de cada hit es un dict propio de la respuesta: se extraen los
+        campos principales con pop y lo que queda son directamente los metadatos.
+        """
+        payload = hit.payload
+        return {
+            "id": hit.id,
+            "score": hit.score,
+            "contenido": payload.pop("contenido", ""),
+            "document_id": payload.pop("document_id", None),
+            "filename": payload.pop("filename", None),
+            "metadata": payload
+        }
+    
+    
+    @staticmethod
+    def _copy_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Copia los resultados cacheados antes de entregarlos al llamador.
+        
+        Así, ordenar la lista o modificar un resultado (o sus metadatos) no
+        altera la respuesta que reciben las siguientes búsquedas en caché.
+        """
+        return [dict(hit, metadata=dict(hit["metadata"])) for hit in hits]
     
     
     def get_collection_info(self) -> Dict[str, Any]:
         """
         Obtiene información sobre las colecciones actuales.
         
+        Igual que get_stats, el resultado se cachea STATS_CACHE_TTL segundos y
+        se invalida en cada escritura: los healthchecks no repiten las consultas.
+        
         Returns:
             Dict con información de las colecciones
         """
@@ -660,6 +1301,19 @@ class QdrantStorageManager:
                 "message": "Qdrant no disponible"
             }
         
+        now = time.monotonic()
+        cached_at, cached_info = self._collection_info_cache
+        if cached_info is not None and now - cached_at < STATS_CACHE_TTL:
+            return cached_info
+        
+        info = self._fetch_collection_info()
+        if "error" not in info:
+            self._collection_info_cache = (now, info)
+        return info
+    
+    
+    def _fetch_collection_info(self) -> Dict[str, Any]:
+        """Consulta a Qdrant la información de ambas colecciones (sin caché)."""
         try:
             doc_info = self.client.get_collection(self.collection_name)
             analysis_info = self.client.get_collection(self.analysis_collection)
@@ -686,15 +1340,43 @@ class QdrantStorageManager:
                 "error": str(e)
             }
         
+    def _invalidate_stats_cache(self) -> None:
+        """Descarta las estadísticas cacheadas tras una escritura en Qdrant."""
+        self._stats_cache = (0.0, None)
+        self._collection_info_cache = (0.0, None)
+    
+    
+    def _invalidate_search_cache(self) -> None:
+        """Descarta los resultados de búsqueda cacheados tras modificar los chunks."""
+        with _search_cache_lock:
+            self._search_cache.clear()
+    
+    
     def get_stats(self) -> Dict[str, Any]:
         """
         Retorna estadísticas reales de documentos y análisis almacenados.
         - Documentos únicos (por document_id, no por chunks)
         - Análisis almacenados
+        
+        El resultado se cachea STATS_CACHE_TTL segundos y se invalida en cada
+        escritura, de modo que consultas seguidas no repiten los scrolls.
         """
         if not self.available:
             return {"status": "error", "message": "Qdrant no disponible"}
         
+        now = time.monotonic()
+        cached_at, cached_stats = self._stats_cache
+        if cached_stats is not None and now - cached_at < STATS_CACHE_TTL:
+            return cached_stats
+        
+        stats = self._compute_stats()
+        if stats["status"] == "success":
+            self._stats_cache = (now, stats)
+        return stats
+    
+    
+    def _compute_stats(self) -> Dict[str, Any]:
+        """Recorre ambas colecciones y calcula las estadísticas de get_stats."""
         try:
             # Contar documentos únicos usando scroll y agrupando por document_id
             all_chunks = self.client.scroll(
@@ -717,6 +1399,7 @@ class QdrantStorageManager:
             # Contar análisis
             all_analysis = self.client.scroll(
                 collection_name=self.analysis_collection,
+                scroll_filter=Filter(must_not=[ANALYSIS_HEAD_CONDITION]),
                 limit=10000,
                 with_payload=["document_id", "analysis_type", "created_at"]
             )
@@ -768,7 +1451,7 @@ class QdrantStorageManager:
                     )]
                 ),
                 limit=1,
-                with_payload=True
+                with_payload=["document_id"]
             )
             points = results[0]
             if points:
@@ -790,6 +1473,7 @@ class QdrantStorageManager:
             # 1. Obtener todos los análisis y sus document_id únicos
             all_analysis = self.client.scroll(
                 collection_name=self.analysis_collection,
+                scroll_filter=Filter(must_not=[ANALYSIS_HEAD_CONDITION]),
                 limit=10000,
                 with_payload=["document_id", "analysis_type", "created_at"]
             )
@@ -852,5 +1536,31 @@ class QdrantStorageManager:
             logger.error(f"❌ Error obteniendo documentos analizados: {e}", exc_info=True)
             return {"status": "error", "message": str(e)}
 
-# Instancia global del gestor de almacenamiento
-storage_manager = QdrantStorageManager()
\ No newline at end of file
+_storage_manager = None
+_storage_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> QdrantStorageManager:
+    """
+    Devuelve el gestor de almacenamiento compartido, creándolo en la primera llamada.
+    
+    La conexión a Qdrant se abre aquí y no al importar el módulo, de modo que
+    un Qdrant caído no bloquea el arranque del servidor durante el timeout.
+    """
+    global _storage_manager
+    if _storage_manager is None:
+        with _storage_manager_lock:
+            if _storage_manager is None:
+                _storage_manager = QdrantStorageManager()
+    return _storage_manager
+
+
+class _LazyStorageManager:
+    """Referencia al gestor compartido que lo crea en el primer acceso a un atributo."""
+    
+    def __getattr__(self, name):
+        return getattr(get_storage_manager(), name)
+
+
+# Instancia global del gestor de almacenamiento (se conecta en el primer uso)
+storage_manager = _LazyStorageManager()
@@ -5,48 +5,481 @@ VERSIÓN MEJORADA:
 - Nuevas funciones de formateo HTML
 """
 
+import hashlib
+import html
+import importlib.util
 import json
 import logging
+import multiprocessing
+import os
 import re
-from typing import Dict, List, Any, Optional
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Any, Optional, Union
 from pathlib import Path
-import PyPDF2
+import numpy as np
 import io
 
+# PyMuPDF (MuPDF en C) extrae texto bastante más rápido que PyPDF2; es opcional
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# pypdfium2 (PDFium, el motor de Chrome) es la alternativa con licencia Apache
+# a PyMuPDF (AGPL); es opcional
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# Serializador JSON en Rust (orjson) para las respuestas; es opcional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# tiktoken (BPE en Rust) permite trocear por tokens en lugar de por caracteres; es opcional
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
+# Contenido binario de un PDF: el buffer decodificado o una vista sin copia sobre él
+PDFBytes = Union[bytes, bytearray, memoryview]
+
+# Cabecera con la que empieza todo PDF ("%PDF-" seguido de la versión)
+_PDF_SIGNATURE = b'%PDF-'
+
+# UUID (document_id) dentro de un texto libre, compilado una sola vez
+_UUID_RE = re.compile(r'[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}', re.IGNORECASE)
+# \s en un patrón str acepta los mismos caracteres que str.isspace
+_WHITESPACE_RE = re.compile(r'\s')
+# Coincide hasta el último espacio en blanco del rango buscado
+_LAST_WHITESPACE_RE = re.compile(r'.*\s', re.DOTALL)
+
+# pdftotext (Poppler, C++) es el extractor de texto más rápido disponible; si
+# está instalado se usa antes que PyMuPDF/PyPDF2. DISABLE_PDFTOTEXT=1 lo desactiva
+_PDFTOTEXT = None if os.getenv("DISABLE_PDFTOTEXT") == "1" else shutil.which("pdftotext")
+_PDFTOTEXT_TIMEOUT = 60
+
+# Backend de extracción: "auto" (PyMuPDF, pypdfium2 o PyPDF2, el primero
+# instalado), "pymupdf", "pdfium" o "pypdf2"
+_PDF_BACKEND = os.getenv("PDF_BACKEND", "auto").lower()
+
+# Extracción con PyMuPDF repartida por rangos de páginas entre procesos. Cada
+# worker es un intérprete aparte (spawn) que importa este módulo, así que se
+# usan pocos y solo para PDFs de cientos de páginas: por debajo del umbral
+# extraer en el propio proceso es más rápido que enviar el PDF a los workers
+_PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+_PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "500"))
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+# Ni MuPDF ni PDFium son thread-safe (PDFium ni siquiera entre documentos
+# distintos) y los PDFs se procesan en hilos de trabajo (asyncio.to_thread):
+# las llamadas al backend dentro del proceso se serializan
+_pdf_backend_lock = threading.Lock()
+
+# Caché única de PDFs recientes, indexada por hash del contenido. Cada entrada
+# reúne el parseo (texto por página e info, que comparten get_pdf_metadata y
+# extract_text_from_pdf) y lo que el executor deriva de él (texto completo,
+# metadatos y chunks), así que un mismo texto no se retiene en dos cachés.
+_PDF_CACHE_MAX_ENTRIES = 16
+# Tope de bytes (UTF-8) retenidos entre todas las entradas: unos pocos
+# contratos enormes no deben acaparar cientos de MB
+_PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024
+_pdf_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# Los PDFs se procesan en hilos de trabajo, así que la caché se protege
+_pdf_cache_lock = threading.Lock()
+
+
+# Modelo de embeddings para el chunking semántico: es el mismo all-MiniLM-L6-v2
+# del almacenamiento y se comparte su instancia (una sola carga por proceso)
+_SENTENCE_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+_sentence_model = None
+_sentence_model_lock = threading.Lock()
+_punkt_ready = False
+
+
+def get_sentence_model():
+    """
+    Devuelve el modelo del chunking semántico, resolviéndolo en la primera llamada.
+    
+    Reutiliza el modelo de embeddings del almacenamiento (get_embedding_model),
+    sea SentenceTransformer o fastembed: ambos exponen encode() y producen los
+    mismos vectores, así que no se carga una segunda copia. Solo si ese modelo
+    no está disponible se carga aquí un SentenceTransformer propio.
+    
+    Returns:
+        Modelo all-MiniLM-L6-v2 listo para codificar
+    """
+    global _sentence_model
+    if _sentence_model is None:
+        with _sentence_model_lock:
+            if _sentence_model is None:
+                # Import diferido: qdrant_storage crea el cliente de Qdrant al importarse
+                from almacenador_agent.qdrant_storage import get_embedding_model
+                model = get_embedding_model()
+                if model is None:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info("🤖 Cargando modelo de embeddings semánticos (all-MiniLM-L6-v2)...")
+                    model = SentenceTransformer(_SENTENCE_MODEL_NAME)
+                _sentence_model = model
+    return _sentence_model
+
+
+# Codificación BPE para el chunking por tokens: se carga una sola vez por proceso.
+# Si la carga falla (p. ej. sin red para la primera descarga) se reintenta
+# pasado _TOKEN_ENCODING_RETRY_S en lugar de desactivar el chunking por tokens
+# para toda la vida del proceso
+_TOKEN_ENCODING_NAME = "cl100k_base"
+_TOKEN_ENCODING_RETRY_S = float(os.getenv("TOKEN_ENCODING_RETRY_S", "300"))
+_token_encoding = None
+_token_encoding_retry_at = 0.0
+_token_encoding_lock = threading.Lock()
+
+
+def get_token_encoding():
+    """
+    Devuelve la codificación BPE compartida, cargándola en la primera llamada.
+    
+    La primera carga descarga la codificación a la caché de tiktoken
+    (TIKTOKEN_CACHE_DIR); por eso se hace en warmup y no en la primera petición.
+    
+    Returns:
+        tiktoken.Encoding, o None si tiktoken no está instalado o la codificación
+        no se pudo cargar (en ese caso se reintenta pasado un intervalo)
+    """
+    global _token_encoding, _token_encoding_retry_at
+    if _token_encoding is None and tiktoken is not None and time.monotonic() >= _token_encoding_retry_at:
+        with _token_encoding_lock:
+            if _token_encoding is None and time.monotonic() >= _token_encoding_retry_at:
+                try:
+                    _token_encoding = tiktoken.get_encoding(_TOKEN_ENCODING_NAME)
+                except Exception as e:
+                    _token_encoding_retry_at = time.monotonic() + _TOKEN_ENCODING_RETRY_S
+                    logger.warning(
+                        f"⚠️ No se pudo cargar la codificación {_TOKEN_ENCODING_NAME} "
+                        f"(se reintentará en {_TOKEN_ENCODING_RETRY_S:.0f}s; "
+                        f"mientras tanto se usa chunking por caracteres): {e}"
+                    )
+    return _token_encoding
+
+
+def _ensure_punkt() -> None:
+    """Descarga el tokenizador de oraciones de NLTK si falta (solo se comprueba una vez)."""
+    global _punkt_ready
+    if _punkt_ready:
+        return
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        logger.info("📥 Descargando recursos NLTK (punkt_tab)...")
+        nltk.download('punkt_tab', quiet=True)
+    _punkt_ready = True
+
+
+def _pdftotext_pages(pdf_content: PDFBytes) -> Optional[List[str]]:
+    """
+    Extrae el texto de cada página con el binario pdftotext de Poppler.
+    
+    Args:
+        pdf_content: Contenido del PDF en bytes (o vista sobre ellos)
+        
+    Returns:
+        Texto por página, o None si pdftotext no está disponible o falla
+        (el llamador recurre entonces a PyMuPDF/PyPDF2)
+    """
+    if _PDFTOTEXT is None:
+        return None
+    
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        with tmp:
+            tmp.write(pdf_content)
+        result = subprocess.run(
+            [_PDFTOTEXT, "-q", "-enc", "UTF-8", tmp.name, "-"],
+            capture_output=True, check=True, timeout=_PDFTOTEXT_TIMEOUT
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"⚠️ pdftotext falló, se usa el extractor de Python: {e}")
+        return None
+    finally:
+        os.unlink(tmp.name)
+    
+    # pdftotext termina cada página con un salto de página (\f)
+    return result.stdout.decode("utf-8", errors="replace").split("\f")[:-1]
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Devuelve el pool de procesos compartido para extraer texto, creándolo en la primera llamada."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        with _pdf_pool_lock:
+            if _pdf_pool is None:
+                # spawn: el proceso padre tiene hilos (servidor, torch, gRPC) y
+                # hacer fork con hilos activos puede dejar locks bloqueados. Los
+                # workers vuelven a ejecutar el módulo principal como __mp_main__:
+                # main.py mantiene sus imports pesados dentro de las funciones
+                _pdf_pool = ProcessPoolExecutor(
+                    max_workers=_PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pdf_pool
+
+
+def _pymupdf_page_range_texts(pdf_content: bytes, start: int, end: int) -> List[str]:
+    """Extrae con PyMuPDF el texto de las páginas [start, end) (se ejecuta en un worker)."""
+    with pymupdf.open(stream=pdf_content, filetype="pdf") as doc:
+        return [doc[page_num].get_text("text") for page_num in range(start, end)]
+
+
+def _pymupdf_page_texts(doc, pdf_content: PDFBytes) -> List[str]:
+    """
+    Extrae el texto de cada página de un documento PyMuPDF ya abierto.
+    
+    Los PDFs grandes se reparten en un rango contiguo de páginas por worker:
+    cada proceso abre el PDF una vez y extrae su rango sin competir por el GIL.
+    
+    Args:
+        doc: Documento PyMuPDF abierto
+        pdf_content: Contenido del PDF (los workers lo abren de nuevo)
+        
+    Returns:
+        List[str]: Texto de cada página, en orden
+    """
+    num_pages = doc.page_count
+    if _PDF_WORKERS < 2 or num_pages < _PDF_PARALLEL_MIN_PAGES:
+        return [page.get_text("text") for page in doc]
+    
+    pdf_bytes = bytes(pdf_content)
+    step = -(-num_pages // _PDF_WORKERS)
+    try:
+        pool = _get_pdf_pool()
+        futures = [
+            pool.submit(_pymupdf_page_range_texts, pdf_bytes, start, min(start + step, num_pages))
+            for start in range(0, num_pages, step)
+        ]
+        page_texts = []
+        for future in futures:
+            page_texts.extend(future.result())
+        return page_texts
+    except Exception as e:
+        logger.warning(f"⚠️ Extracción en paralelo fallida, se extrae en serie: {e}")
+        return [page.get_text("text") for page in doc]
+
+
+def _pdfium_page_texts(pdf) -> List[str]:
+    """
+    Extrae el texto de cada página de un documento pypdfium2 ya abierto.
+    
+    PDFium no es thread-safe: el llamador debe tener _pdf_backend_lock. Las
+    páginas y sus textpages se cierran al terminar para liberar la memoria
+    de PDFium sin esperar al recolector. PDFium separa las líneas con CRLF;
+    se normalizan a LF como en el resto de backends.
+    
+    Args:
+        pdf: pdfium.PdfDocument abierto
+        
+    Returns:
+        List[str]: Texto de cada página, en orden
+    """
+    page_texts = []
+    for page in pdf:
+        textpage = page.get_textpage()
+        try:
+            page_texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+        finally:
+            textpage.close()
+            page.close()
+    return page_texts
+
+
+def _pdf_backend() -> str:
+    """Resuelve el backend de extracción según PDF_BACKEND y los módulos instalados."""
+    if _PDF_BACKEND == "pymupdf" and pymupdf is not None:
+        return "pymupdf"
+    if _PDF_BACKEND == "pdfium" and pdfium is not None:
+        return "pdfium"
+    if _PDF_BACKEND == "pypdf2":
+        return "pypdf2"
+    if pymupdf is not None:
+        return "pymupdf"
+    if pdfium is not None:
+        return "pdfium"
+    return "pypdf2"
+
+
+def pdf_content_hash(pdf_content: PDFBytes) -> str:
+    """Clave de la caché de PDFs: hash BLAKE2b de los bytes del archivo."""
+    return hashlib.blake2b(pdf_content, digest_size=16).hexdigest()
+
+
+def get_cached_pdf(content_hash: str) -> Optional[Dict[str, Any]]:
+    """Devuelve la entrada cacheada de un PDF y la marca como usada recientemente."""
+    with _pdf_cache_lock:
+        entry = _pdf_cache.get(content_hash)
+        if entry is not None:
+            _pdf_cache.move_to_end(content_hash)
+        return entry
+
+
+def _pdf_entry_bytes(entry: Dict[str, Any]) -> int:
+    """Bytes (UTF-8) de texto que retiene una entrada: páginas, texto completo y chunks."""
+    texts = [*(entry.get("page_texts") or ()), entry.get("text") or "", *(entry.get("chunks") or ())]
+    # surrogatepass: el texto extraído de un PDF puede traer sustitutos sueltos
+    return sum(len(text.encode("utf-8", "surrogatepass")) for text in texts)
+
+
+def cache_pdf(content_hash: str, **fields) -> None:
+    """
+    Guarda (o completa) la entrada de un PDF, descartando las más antiguas si se
+    excede el número de entradas o el tope de bytes. Un PDF que por sí solo
+    supera el tope no se queda en la caché.
+    """
+    with _pdf_cache_lock:
+        entry = _pdf_cache.setdefault(content_hash, {})
+        entry.update(fields)
+        # El tamaño se mide al guardar, no en cada desalojo
+        entry["size_bytes"] = _pdf_entry_bytes(entry)
+        _pdf_cache.move_to_end(content_hash)
+        while len(_pdf_cache) > _PDF_CACHE_MAX_ENTRIES:
+            _pdf_cache.popitem(last=False)
+        total_bytes = sum(cached["size_bytes"] for cached in _pdf_cache.values())
+        while _pdf_cache and total_bytes > _PDF_CACHE_MAX_BYTES:
+            _, evicted = _pdf_cache.popitem(last=False)
+            total_bytes -= evicted["size_bytes"]
+
+
+def _parse_pdf(pdf_content: PDFBytes) -> Dict[str, Any]:
+    """
+    Abre el PDF una sola vez y extrae el texto de cada página y su diccionario de información.
+    
+    Args:
+        pdf_content: Contenido del PDF en bytes (o vista sobre ellos)
+        
+    Returns:
+        Dict con 'page_texts' (texto por página) e 'info' (título, autor y asunto, o None)
+    """
+    key = pdf_content_hash(pdf_content)
+    cached = get_cached_pdf(key)
+    if cached is not None and cached.get("page_texts") is not None:
+        return cached
+    
+    # Con pdftotext el backend de Python solo lee los metadatos y el número
+    # de páginas, que sirve además para validar su salida
+    page_texts = _pdftotext_pages(pdf_content)
+    backend = _pdf_backend()
+    
+    if backend == "pymupdf":
+        with _pdf_backend_lock, pymupdf.open(stream=pdf_content, filetype="pdf") as doc:
+            doc_info = doc.metadata or {}
+            if page_texts is None or len(page_texts) != doc.page_count:
+                page_texts = _pymupdf_page_texts(doc, pdf_content)
+            # doc.metadata siempre trae 'format': solo cuentan los campos que se devuelven
+            info = {field: doc_info.get(field) for field in ("title", "author", "subject")}
+            parsed = {
+                "page_texts": page_texts,
+                "info": {
+                    field: value or 'N/A' for field, value in info.items()
+                } if any(info.values()) else None
+            }
+    elif backend == "pdfium":
+        # PdfDocument solo acepta bytes (no bytearray ni memoryview)
+        with _pdf_backend_lock:
+            pdf = pdfium.PdfDocument(pdf_content if isinstance(pdf_content, bytes) else bytes(pdf_content))
+            try:
+                doc_info = pdf.get_metadata_dict()
+                if page_texts is None or len(page_texts) != len(pdf):
+                    page_texts = _pdfium_page_texts(pdf)
+            finally:
+                pdf.close()
+        info = {field: doc_info.get(field.capitalize()) for field in ("title", "author", "subject")}
+        parsed = {
+            "page_texts": page_texts,
+            "info": {
+                field: value or 'N/A' for field, value in info.items()
+            } if any(info.values()) else None
+        }
+    else:
+        # Import diferido: PyPDF2 tarda en importarse y solo hace falta como último recurso
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
+        if page_texts is None or len(page_texts) != len(pdf_reader.pages):
+            page_texts = [page.extract_text() for page in pdf_reader.pages]
+        parsed = {
+            "page_texts": page_texts,
+            "info": {
+                "title": pdf_reader.metadata.get('/Title', 'N/A'),
+                "author": pdf_reader.metadata.get('/Author', 'N/A'),
+                "subject": pdf_reader.metadata.get('/Subject', 'N/A'),
+            } if pdf_reader.metadata else None
+        }
+    
+    cache_pdf(key, **parsed)
+    return parsed
+
 
 class PDFProcessor:
     """
     Clase para procesar archivos PDF y extraer su contenido de texto.
     """
     
+    # Disponibilidad del chunking semántico, resuelta una sola vez al importar
+    # el módulo (sin cargar torch): True si sentence-transformers y nltk están instalados
+    SEMANTIC_AVAILABLE = all(
+        importlib.util.find_spec(module) is not None
+        for module in ("sentence_transformers", "nltk")
+    )
+    
+    @staticmethod
+    def warmup() -> None:
+        """
+        Precarga el modelo y el tokenizador del chunking semántico para que
+        la primera petición no pague su carga.
+        """
+        if PDFProcessor.SEMANTIC_AVAILABLE:
+            _ensure_punkt()
+            get_sentence_model().encode(["warmup"], show_progress_bar=False)
+        get_token_encoding()
+    
+
     @staticmethod
-    def extract_text_from_pdf(pdf_content: bytes) -> str:
+    def extract_text_from_pdf(pdf_content: PDFBytes) -> str:
         """
         Extrae todo el texto de un archivo PDF.
         
         Args:
-            pdf_content: Contenido del PDF en bytes
+            pdf_content: Contenido del PDF en bytes (o vista sobre ellos)
             
         Returns:
             str: Texto extraído del PDF, página por página
         """
         try:
-            pdf_file = io.BytesIO(pdf_content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text_pages = []
-            
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
-                
+            page_texts = _parse_pdf(pdf_content)["page_texts"]
+            # Se escribe directamente en un buffer: el separador va delante
+            # de cada página salvo la primera, igual que "\n\n".join
+            buffer = io.StringIO()
+            separator = ""
+
+            for page_num, text in enumerate(page_texts):
                 if text.strip():
-                    text_pages.append(f"--- Página {page_num + 1} ---\n{text}")
-                    
-            full_text = "\n\n".join(text_pages)
+                    buffer.write(f"{separator}--- Página {page_num + 1} ---\n")
+                    buffer.write(text)
+                    separator = "\n\n"
+
+            full_text = buffer.getvalue()
             
-            logger.info(f"✓ PDF procesado exitosamente: {len(pdf_reader.pages)} páginas")
+            logger.info(f"✓ PDF procesado exitosamente: {len(page_texts)} páginas")
             return full_text
             
         except Exception as e:
@@ -54,6 +487,149 @@ class PDFProcessor:
             raise ValueError(f"No se pudo procesar el PDF: {str(e)}")
     
 
+    @staticmethod
+    def iter_chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+        """
+        Genera los fragmentos de tamaño fijo uno a uno, sin construir la lista completa.
+        
+        Los cortes se ajustan al último espacio en blanco (cualquier carácter con
+        str.isspace) de cada ventana, de modo que las palabras no quedan partidas
+        entre fragmentos (salvo palabras más largas que la ventana). Cuando no
+        hay espacio en el que ajustar, las ventanas siguen la rejilla fija de
+        paso chunk_size - overlap, igual que el troceado sin ajuste.
+        
+        Args:
+            text: Texto completo a fragmentar
+            chunk_size: Número máximo de caracteres por fragmento
+            overlap: Caracteres compartidos entre fragmentos consecutivos
+            
+        Yields:
+            str: Cada fragmento no vacío, en orden
+        """
+        if overlap >= chunk_size:
+            raise ValueError("overlap debe ser menor que chunk_size")
+        
+        step = chunk_size - overlap
+        start = 0
+        while start < len(text):
+            end = start + chunk_size
+            if end < len(text):
+                # Cortar en el último espacio de la ventana para no partir una palabra,
+                # siempre que el fragmento supere el solapamiento (así la ventana avanza)
+                last_space = _LAST_WHITESPACE_RE.match(text, start, end + 1)
+                if last_space and last_space.end() - 1 > start + overlap:
+                    end = last_space.end() - 1
+                next_start = end - overlap
+            else:
+                end = len(text)
+                next_start = start + step
+            
+            chunk = text[start:end].strip()
+            if chunk:
+                yield chunk
+            
+            # La siguiente ventana retrocede `overlap` caracteres; si cae a mitad
+            # de una palabra que este fragmento contiene entera, empieza tras ella
+            if (
+                next_start < len(text)
+                and not text[next_start - 1].isspace()
+                and (start == 0 or _WHITESPACE_RE.search(text, start - 1, next_start))
+            ):
+                word_end = _WHITESPACE_RE.search(text, next_start, end + 1)
+                if word_end:
+                    next_start = word_end.end()
+                elif end == len(text):
+                    # Lo que queda es el final de una palabra ya emitida entera
+                    return
+            start = next_start
+    
+
+    @staticmethod
+    def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+        """
+        Divide el texto en fragmentos de tamaño fijo con solapamiento.
+        Es el fallback de semantic_chunking cuando sus dependencias no están instaladas.
+        
+        Args:
+            text: Texto completo a fragmentar
+            chunk_size: Número máximo de caracteres por fragmento
+            overlap: Caracteres compartidos entre fragmentos consecutivos
+            
+        Returns:
+            List[str]: Lista de fragmentos no vacíos
+        """
+        chunks = list(PDFProcessor.iter_chunk_text(text, chunk_size, overlap))
+        logger.info(f"✓ Chunking por caracteres: {len(chunks)} chunks generados")
+        return chunks
+    
+
+    @staticmethod
+    def token_chunk_text(text: str, chunk_size: int = 200, overlap: int = 40) -> List[str]:
+        """
+        Divide el texto en ventanas de tokens BPE con solapamiento.
+        
+        El tamaño se mide en tokens y no en caracteres, una unidad mucho más
+        cercana al límite del modelo de embeddings (256 tokens WordPiece en
+        all-MiniLM-L6-v2) que la de chunk_text. Como un BPE parte las palabras
+        en varios tokens, los bordes de cada ventana se retrasan (el final) o
+        adelantan (el inicio del solapamiento) hasta el límite de palabra más
+        cercano; solo una palabra más larga que la ventana entera se corta.
+        Cada fragmento es un trozo literal del texto original: los tokens se
+        traducen a posiciones de carácter y se corta el texto por ellas.
+        Sin tiktoken recurre a chunk_text.
+        
+        Args:
+            text: Texto completo a fragmentar
+            chunk_size: Número máximo de tokens por fragmento
+            overlap: Tokens compartidos entre fragmentos consecutivos
+            
+        Returns:
+            List[str]: Lista de fragmentos no vacíos
+        """
+        if overlap >= chunk_size:
+            raise ValueError("overlap debe ser menor que chunk_size")
+        
+        encoding = get_token_encoding()
+        if encoding is None:
+            return PDFProcessor.chunk_text(text)
+        
+        token_ids = encoding.encode(text, disallowed_special=())
+        # Posición en el texto del carácter donde empieza cada token
+        _, offsets = encoding.decode_with_offsets(token_ids)
+        offsets.append(len(text))
+        n_tokens = len(token_ids)
+        
+        def starts_word(k: int) -> bool:
+            # El token k empieza palabra si hay espacio en blanco justo antes o
+            # al comienzo del token (los BPE suelen pegar el espacio a la palabra)
+            pos = offsets[k]
+            return pos <= 0 or pos >= len(text) or text[pos].isspace() or text[pos - 1].isspace()
+        
+        chunks = []
+        start = 0
+        while start < n_tokens:
+            end = min(start + chunk_size, n_tokens)
+            if end < n_tokens:
+                cut = end
+                while cut > start and not starts_word(cut):
+                    cut -= 1
+                if cut > start:
+                    end = cut
+            chunk = text[offsets[start]:offsets[end]].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end == n_tokens:
+                break
+            # El solapamiento empieza en la siguiente palabra completa
+            next_start = max(end - overlap, start + 1)
+            while next_start < end and not starts_word(next_start):
+                next_start += 1
+            start = next_start
+        
+        logger.info(f"✓ Chunking por tokens: {len(chunks)} chunks generados")
+        return chunks
+    
+
     @staticmethod
     def semantic_chunking(text: str, similarity_threshold: float = 0.5) -> List[str]:
         """
@@ -79,7 +655,7 @@ class PDFProcessor:
             ImportError: Si sentence-transformers o nltk no están instalados.
         """
         try:
-            from sentence_transformers import SentenceTransformer, util
+            import sentence_transformers  # noqa: F401
             import nltk
         except ImportError as e:
             logger.error(
@@ -92,15 +668,10 @@ class PDFProcessor:
             )
 
         # Descargar tokenizador de oraciones si no está disponible
-        try:
-            nltk.data.find('tokenizers/punkt_tab')
-        except LookupError:
-            logger.info("📥 Descargando recursos NLTK (punkt_tab)...")
-            nltk.download('punkt_tab', quiet=True)
+        _ensure_punkt()
 
-        # Cargar modelo ligero y eficiente para generar embeddings
-        logger.info("🤖 Cargando modelo de embeddings semánticos (all-MiniLM-L6-v2)...")
-        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        # Modelo ligero y eficiente para generar embeddings (compartido entre peticiones)
+        model = get_sentence_model()
 
         # Tokenizar el texto en oraciones individuales
         sentences = nltk.sent_tokenize(text)
@@ -114,27 +685,21 @@ class PDFProcessor:
 
         # Generar embeddings para todas las oraciones en un solo paso (eficiente)
         logger.info(f"🔢 Generando embeddings para {len(sentences)} oraciones...")
-        embeddings = model.encode(sentences, show_progress_bar=False)
+        embeddings = model.encode(
+            sentences, show_progress_bar=False, convert_to_numpy=True
+        )
 
         # Calcular similitud coseno entre oraciones consecutivas
-        similarities = [
-            util.cos_sim(embeddings[i], embeddings[i + 1]).item()
-            for i in range(len(embeddings) - 1)
-        ]
+        similarities = _consecutive_cosine_similarities(embeddings)
 
         # Agrupar oraciones en chunks según el umbral de similitud
         # Cuando la similitud cae por debajo del umbral → ruptura semántica → nuevo chunk
-        raw_chunks = []
-        current_chunk = [sentences[0]]
-
-        for i, score in enumerate(similarities):
-            if score < similarity_threshold:
-                raw_chunks.append(" ".join(current_chunk))
-                current_chunk = []
-            current_chunk.append(sentences[i + 1])
-
-        if current_chunk:
-            raw_chunks.append(" ".join(current_chunk))
+        breaks = (np.flatnonzero(similarities < similarity_threshold) + 1).tolist()
+        bounds = [0, *breaks, len(sentences)]
+        raw_chunks = [
+            " ".join(sentences[start:end])
+            for start, end in zip(bounds, bounds[1:])
+        ]
 
         # Limpieza y filtrado de chunks 
         # Elimina prefijos de numeración al inicio: "1.", "I.", "2.1.", "III." etc.
@@ -181,240 +746,289 @@ class PDFProcessor:
         return filtered_chunks
 
 
-class ResponseFormatter:
+def _consecutive_cosine_similarities(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Calcula la similitud coseno entre cada par de filas consecutivas.
+
+    Normaliza la matriz una sola vez y resuelve todos los productos punto
+    en una única operación vectorizada, sin bucles en Python.
+
+    Args:
+        embeddings: Matriz (n_oraciones, dimensión) de embeddings.
+
+    Returns:
+        np.ndarray: Vector de n_oraciones - 1 similitudes.
     """
-    Clase para formatear respuestas en JSON y HTML estructurado.
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+    return np.einsum("ij,ij->i", normalized[:-1], normalized[1:])
+
+
+# FORMATEO DE RESPUESTAS
+def to_json(obj: Any) -> str:
     """
+    Serializa una respuesta a JSON indentado (2 espacios) sin escapar los no ASCII.
     
-    @staticmethod
-    def format_success_response(
-        operation: str,
-        data: Dict[str, Any],
-        message: str = "Operación exitosa"
-    ) -> str:
-        """
-        Crea una respuesta JSON exitosa.
-        
-        Args:
-            operation: Tipo de operación realizada
-            data: Datos relevantes de la operación
-            message: Mensaje descriptivo
-            
-        Returns:
-            str: JSON formateado como string
-        """
-        response = {
-            "status": "success",
-            "operation": operation,
-            "message": message,
-            "data": data,
-            "timestamp": None
-        }
+    Usa orjson si está instalado; si no, o si orjson no admite algún valor,
+    json.dumps(obj, ensure_ascii=False, indent=2). Ambos producen el mismo
+    JSON una vez parseado, pero no siempre el mismo texto: orjson escribe los
+    exponentes sin ceros a la izquierda (1e-7 frente a 1e-07) y NaN/Infinity
+    como null.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def format_success_response(
+    operation: str,
+    data: Dict[str, Any],
+    message: str = "Operación exitosa"
+) -> str:
+    """
+    Crea una respuesta JSON exitosa.
+    
+    Args:
+        operation: Tipo de operación realizada
+        data: Datos relevantes de la operación
+        message: Mensaje descriptivo
         
-        return json.dumps(response, ensure_ascii=False, indent=2)
+    Returns:
+        str: JSON formateado como string
+    """
+    response = {
+        "status": "success",
+        "operation": operation,
+        "message": message,
+        "data": data,
+        "timestamp": None
+    }
     
+    return to_json(response)
+
+
+def format_error_response(
+    operation: str,
+    error_message: str,
+    error_type: str = "ProcessingError"
+) -> str:
+    """
+    Crea una respuesta JSON de error.
     
-    @staticmethod
-    def format_error_response(
-        operation: str,
-        error_message: str,
-        error_type: str = "ProcessingError"
-    ) -> str:
-        """
-        Crea una respuesta JSON de error.
+    Args:
+        operation: Tipo de operación que falló
+        error_message: Descripción del error
+        error_type: Tipo de error
         
-        Args:
-            operation: Tipo de operación que falló
-            error_message: Descripción del error
-            error_type: Tipo de error
-            
-        Returns:
-            str: JSON formateado como string
-        """
-        response = {
-            "status": "error",
-            "operation": operation,
-            "error": {
-                "type": error_type,
-                "message": error_message
-            }
+    Returns:
+        str: JSON formateado como string
+    """
+    response = {
+        "status": "error",
+        "operation": operation,
+        "error": {
+            "type": error_type,
+            "message": error_message
         }
-        
-        return json.dumps(response, ensure_ascii=False, indent=2)
+    }
     
+    return to_json(response)
+
+
+def format_storage_response(
+    num_chunks: int,
+    total_characters: int,
+    collection_name: str,
+    document_id: Optional[str] = None,
+    was_updated: bool = False
+) -> str:
+    """
+    Formatea la respuesta después de almacenar en Qdrant.
     
-    @staticmethod
-    def format_storage_response(
-        num_chunks: int,
-        total_characters: int,
-        collection_name: str,
-        document_id: Optional[str] = None,
-        was_updated: bool = False
-    ) -> str:
-        """
-        Formatea la respuesta después de almacenar en Qdrant.
-        
-        Args:
-            num_chunks: Número de fragmentos almacenados
-            total_characters: Total de caracteres procesados
-            collection_name: Nombre de la colección en Qdrant
-            document_id: ID del documento almacenado
-            was_updated: Si fue una actualización de documento existente
-            
-        Returns:
-            str: JSON con información del almacenamiento
-        """
-        data = {
-            "chunks_stored": num_chunks,
-            "total_characters": total_characters,
-            "collection": collection_name,
-            "document_id": document_id,
-            "was_updated": was_updated,
-            "storage_location": "qdrant_local"
-        }
-        
-        action = "actualizado" if was_updated else "almacenado"
-        message = f"PDF {action} exitosamente en {num_chunks} fragmentos"
+    Args:
+        num_chunks: Número de fragmentos almacenados
+        total_characters: Total de caracteres procesados
+        collection_name: Nombre de la colección en Qdrant
+        document_id: ID del documento almacenado
+        was_updated: Si fue una actualización de documento existente
         
-        return ResponseFormatter.format_success_response(
-            operation="store_pdf",
-            data=data,
-            message=message
-        )
+    Returns:
+        str: JSON con información del almacenamiento
+    """
+    data = {
+        "chunks_stored": num_chunks,
+        "total_characters": total_characters,
+        "collection": collection_name,
+        "document_id": document_id,
+        "was_updated": was_updated,
+        "storage_location": "qdrant_local"
+    }
     
+    action = "actualizado" if was_updated else "almacenado"
+    message = f"PDF {action} exitosamente en {num_chunks} fragmentos"
     
-    @staticmethod
-    def render_storage_response_html(response: dict) -> str:
-        """
-        Renderiza la respuesta de almacenamiento en HTML.
+    return format_success_response(
+        operation="store_pdf",
+        data=data,
+        message=message
+    )
+
+
+def render_storage_response_html(response: dict) -> str:
+    """
+    Renderiza la respuesta de almacenamiento en HTML.
+    
+    Args:
+        response: Diccionario con la respuesta
         
-        Args:
-            response: Diccionario con la respuesta
-            
-        Returns:
-            str: HTML formateado
-        """
-        was_updated = response.get("data", {}).get("was_updated", False)
-        icon = "🔄" if was_updated else "📄"
-        action = "Actualización" if was_updated else "Almacenamiento"
+    Returns:
+        str: HTML formateado
+    """
+    data = response["data"]
+    was_updated = data.get("was_updated", False)
+    icon = "🔄" if was_updated else "📄"
+    action = "actualización" if was_updated else "almacenamiento"
+    kind = "Actualización de documento existente" if was_updated else "Nuevo documento"
+    
+    # El nombre del archivo y el mensaje vienen del usuario: se escapan para
+    # que no puedan inyectar HTML/JS en el frontend
+    escape = html.escape
+    return f"""
+        <h3>{icon} Reporte de {action}</h3>
+
+        <p><b>Estado:</b> {escape(str(response.get("status")))}</p>
+        <p><b>Operación:</b> {escape(str(response.get("operation")))}</p>
+
+        <p>{escape(str(response.get("message")))}</p>
+
+        <h3>📊 Detalles del proceso</h3>
+        <ul>
+            <li><b>Nombre del documento:</b> {escape(str(data.get("filename", "N/A")))}</li>
+            <li><b>Fragmentos almacenados:</b> {data["chunks_stored"]}</li>
+            <li><b>Total de caracteres:</b> {data["total_characters"]}</li>
+            <li><b>Colección:</b> {escape(str(data["collection"]))}</li>
+            <li><b>Tipo:</b> {kind}</li>
+            <li>
+                <b>Document ID:</b>
+                <code>{escape(str(data.get("document_id", "N/A")))}</code>
+            </li>
+        </ul>
+    """
+
+
+def render_analysis_response_html(
+    analysis_list: List[Dict[str, Any]],
+    document_id: Optional[str] = None
+) -> str:
+    """
+    Renderiza una lista de análisis en HTML.
+    
+    Args:
+        analysis_list: Lista de análisis recuperados
+        document_id: ID del documento (opcional)
         
-        return f"""
-            <h3>{icon} Reporte de {action.lower()}</h3>
-
-            <p><b>Estado:</b> {response.get("status")}</p>
-            <p><b>Operación:</b> {response.get("operation")}</p>
-
-            <p>{response.get("message")}</p>
-
-            <h3>📊 Detalles del proceso</h3>
-            <ul>
-                <li><b>Nombre del documento:</b> {response["data"].get("filename", "N/A")}</li>
-                <li><b>Fragmentos almacenados:</b> {response["data"]["chunks_stored"]}</li>
-                <li><b>Total de caracteres:</b> {response["data"]["total_characters"]}</li>
-                <li><b>Colección:</b> {response["data"]["collection"]}</li>
-                <li><b>Tipo:</b> {"Actualización de documento existente" if was_updated else "Nuevo documento"}</li>
-                <li>
-                    <b>Document ID:</b>
-                    <code>{response["data"].get("document_id", "N/A")}</code>
-                </li>
-            </ul>
+    Returns:
+        str: HTML formateado
+    """
+    if not analysis_list:
+        return """
+        <h3>📭 No se encontraron análisis</h3>
+        <p>No hay análisis almacenados para este documento.</p>
         """
     
+    # Los campos vienen del LLM o del usuario: se escapan para que el
+    # contenido no pueda inyectar HTML/JS en el frontend
+    escape = html.escape
+    html_parts = [
+        f"<h3>📊 Análisis encontrados ({len(analysis_list)})</h3>"
+    ]
     
-    @staticmethod
-    def render_analysis_response_html(
-        analysis_list: List[Dict[str, Any]],
-        document_id: Optional[str] = None
-    ) -> str:
-        """
-        Renderiza una lista de análisis en HTML.
-        
-        Args:
-            analysis_list: Lista de análisis recuperados
-            document_id: ID del documento (opcional)
+    if document_id:
+        html_parts.append(f"<p><b>Document ID:</b> {escape(document_id[:16])}...</p>")
+    
+    for i, analysis in enumerate(analysis_list, 1):
+        html_parts.append(f"""
+        <div>
+            <h3>🔍 Análisis #{i}</h3>
+            <p><b>ID:</b> {escape(analysis['analysis_id'][:16])}...</p>
+            <p><b>Documento:</b> {escape(analysis['document_id'][:16])}...</p>
+            <p><b>Tipo:</b> {escape(str(analysis['analysis_type']))}</p>
+            <p><b>Fecha:</b> {escape(str(analysis['created_at']))}</p>
             
-        Returns:
-            str: HTML formateado
-        """
-        if not analysis_list:
-            return """
-            <h3>📭 No se encontraron análisis</h3>
-            <p>No hay análisis almacenados para este documento.</p>
-            """
-        
-        html_parts = [
-            f"<h3>📊 Análisis encontrados ({len(analysis_list)})</h3>"
-        ]
-        
-        if document_id:
-            html_parts.append(f"<p><b>Document ID:</b> {document_id[:16]}...</p>")
-        
-        for i, analysis in enumerate(analysis_list, 1):
-            html_parts.append(f"""
+            <h3>📝 Contenido:</h3>
             <div>
-                <h3>🔍 Análisis #{i}</h3>
-                <p><b>ID:</b> {analysis['analysis_id'][:16]}...</p>
-                <p><b>Documento:</b> {analysis['document_id'][:16]}...</p>
-                <p><b>Tipo:</b> {analysis['analysis_type']}</p>
-                <p><b>Fecha:</b> {analysis['created_at']}</p>
-                
-                <h3>📝 Contenido:</h3>
-                <div>
-                    {analysis['analysis_content']}
-                </div>
+                {escape(analysis['analysis_content'])}
             </div>
-            """)
-        
-        return "\n".join(html_parts)
+        </div>
+        """)
+    
+    return "\n".join(html_parts)
+
+
+class ResponseFormatter:
+    """
+    Espacio de nombres con los formateadores de respuestas JSON y HTML.
+    
+    Se mantiene por compatibilidad: los métodos son alias de las funciones
+    de módulo, que es lo que deben usar los llamadores nuevos.
+    """
+    
+    to_json = staticmethod(to_json)
+    format_success_response = staticmethod(format_success_response)
+    format_error_response = staticmethod(format_error_response)
+    format_storage_response = staticmethod(format_storage_response)
+    render_storage_response_html = staticmethod(render_storage_response_html)
+    render_analysis_response_html = staticmethod(render_analysis_response_html)
 
 
 # FUNCIONES DE UTILIDAD
-def validate_pdf_content(content: bytes) -> bool:
+def validate_pdf_content(content: PDFBytes) -> bool:
     """
     Valida que el contenido sea un PDF válido.
     
     Args:
-        content: Bytes del archivo a validar
+        content: Bytes del archivo a validar (o vista sobre ellos)
         
     Returns:
         bool: True si es un PDF válido
     """
-    try:
-        pdf_signature = b'%PDF'
-        return content.startswith(pdf_signature)
-    except Exception:
-        return False
+    # La vista compara solo la cabecera, sin copiar el buffer; cualquier otro
+    # tipo (str, None...) no es un PDF
+    return (
+        isinstance(content, (bytes, bytearray, memoryview))
+        and memoryview(content)[:len(_PDF_SIGNATURE)] == _PDF_SIGNATURE
+    )
 
 
-def get_pdf_metadata(pdf_content: bytes) -> Dict[str, Any]:
+def get_pdf_metadata(pdf_content: PDFBytes) -> Dict[str, Any]:
     """
     Extrae metadatos del PDF.
     
     Args:
-        pdf_content: Contenido del PDF en bytes
+        pdf_content: Contenido del PDF en bytes (o vista sobre ellos)
         
     Returns:
         Dict con metadatos del PDF
     """
     try:
-        pdf_file = io.BytesIO(pdf_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        # El parseo queda cacheado para la extracción de texto que sigue
+        parsed = _parse_pdf(pdf_content)
+        page_texts = parsed["page_texts"]
         
         metadata = {
-            "num_pages": len(pdf_reader.pages),
+            "num_pages": len(page_texts),
             "has_text": False
         }
         
-        if len(pdf_reader.pages) > 0:
-            first_page_text = pdf_reader.pages[0].extract_text()
-            metadata["has_text"] = bool(first_page_text.strip())
+        if page_texts:
+            metadata["has_text"] = bool(page_texts[0].strip())
         
-        if pdf_reader.metadata:
-            metadata.update({
-                "title": pdf_reader.metadata.get('/Title', 'N/A'),
-                "author": pdf_reader.metadata.get('/Author', 'N/A'),
-                "subject": pdf_reader.metadata.get('/Subject', 'N/A'),
-            })
+        if parsed["info"]:
+            metadata.update(parsed["info"])
         
         return metadata
         
@@ -433,7 +1047,5 @@ def extract_document_id_from_text(text: str) -> Optional[str]:
     Returns:
         str: UUID encontrado o None
     """
-    import re
-    uuid_pattern = r'[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}'
-    match = re.search(uuid_pattern, text, re.IGNORECASE)
+    match = _UUID_RE.search(text)
     return match.group(0) if match else None
\ No newline at end of file
@@ -124,23 +124,20 @@ class ContractAnalyzerExecutor(AgentExecutor):
                 if hasattr(message, 'parts') and message.parts:
                     user_parts = message.parts
                     
-                    # Recopilar todas las parts de texto
-                    text_parts = []
-                    for part in user_parts:
+                    # Tomar la última instrucción real: se recorren las parts desde el
+                    # final y se para en la primera de texto que no sea historial
+                    # inyectado por A2A, sin construir listas intermedias
+                    for part in reversed(user_parts):
                         if isinstance(part, Part):
                             root = getattr(part, 'root', None)
                             if isinstance(root, TextPart):
-                                text_parts.append(root.text)
-                    
-                    # Filtrar historial inyectado por A2A y quedarse solo con la instrucción actual
-                    actual_instruction_parts = [
-                        t for t in text_parts
-                        if not t.startswith("For context:")
-                        and not (t.startswith("[") and ("] called tool" in t or "] said:" in t or "] `" in t))
-                    ]
-                    
-                    # Tomar la última instrucción real
-                    user_text = actual_instruction_parts[-1] if actual_instruction_parts else ""
+                                t = root.text
+                                if t.startswith("For context:") or (
+                                    t.startswith("[") and ("] called tool" in t or "] said:" in t or "] `" in t)
+                                ):
+                                    continue
+                                user_text = t
+                                break
 
             logger.info(f"📝 Texto del usuario: {user_text[:100] if user_text else 'Sin texto'}")
             logger.info(f"📦 Número de partes: {len(user_parts)}")